@@ -18,6 +18,9 @@ from .stealth_key_tool import *
 from .pbkdf2 import *
 from .bip32utils import *
 from .bip39 import *
+from .sweep import sweep_passphrases, read_candidates
+from .keybatch import KeyBatch
+from .validate import validate_records, read_records
 
 
 
@@ -25,8 +28,20 @@ __all__ = ["PURPOSE",
            "get_currency",
            "seed_from_mnemonic",
            "key_from_mnemonic",
+           "seeds_from_mnemonics",
+           "keys_from_mnemonics",
+           "KeyCache",
+           "KeyBatch",
+           "DerivationTree",
+           "sweep_passphrases",
+           "read_candidates",
+           "validate_records",
+           "read_records",
            "get_p2pkh_address",
+           "get_p2pkh_addresses",
            "get_eth_address",
+           "get_addresses",
+           "ADDRESS_FORMATS",
            "get_child_key",
            "get_path",
            "get_wif",
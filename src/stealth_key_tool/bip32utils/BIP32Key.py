@@ -10,13 +10,15 @@ import hashlib
 import ecdsa
 import struct
 import codecs
+import threading
+import collections
 from . import Base58
+from . import Bech32
+from . import secp256k1
+from . import ripemd160
 
-from hashlib import sha256
 from binascii import b2a_hex
 from ecdsa.curves import SECP256k1
-from ecdsa.ecdsa import int_to_string, string_to_int
-from ecdsa.numbertheory import square_root_mod_prime as sqrt_mod
 
 MIN_ENTROPY_LEN = 128        # bits
 BIP32_HARDEN    = 0x80000000 # choose from hardened set of child keys
@@ -28,9 +30,21 @@ EX_MAIN_PRIVATE = [ codecs.decode('0488ade4', 'hex') ] # Version strings for mai
 EX_MAIN_PUBLIC  = [ codecs.decode('0488b21e', 'hex'), codecs.decode('049d7cb2', 'hex') ] # Version strings for mainnet extended public keys
 EX_TEST_PRIVATE = [ codecs.decode('04358394', 'hex') ] # Version strings for testnet extended private keys
 EX_TEST_PUBLIC  = [ codecs.decode('043587CF', 'hex') ] # Version strings for testnet extended public keys
+# (is testnet, is public) of each version string
+EX_VERSIONS = dict([(v, (False, False)) for v in EX_MAIN_PRIVATE] +
+                   [(v, (True, False)) for v in EX_TEST_PRIVATE] +
+                   [(v, (False, True)) for v in EX_MAIN_PUBLIC] +
+                   [(v, (True, True)) for v in EX_TEST_PUBLIC])
 
 class BIP32Key(object):
 
+    # Keys are held by the million in audits, so they have no __dict__:
+    # the secret is an int, the public point a tuple of two ints, and
+    # the ecdsa objects and encodings are only made when asked for
+    __slots__ = ("public", "secret", "_point", "_k", "_K", "_cK", "_uK",
+                 "_id", "_C", "_mac", "depth", "index", "_parent_secret",
+                 "_parent_fpr", "testnet")
+
     # Static initializers to create from entropy or external formats
     #
     @staticmethod
@@ -50,40 +64,51 @@ class BIP32Key(object):
         return key
 
     @staticmethod
-    def fromExtendedKey(xkey, public=False):
+    def fromExtendedKey(xkey, public=False, cache=None):
         """
         Create a BIP32Key by importing from extended private or public key string
 
         If public is True, return a public-only key regardless of input type.
+        If an ExtendedKeyCache is given as cache, the key is looked up in (and
+        added to) the cache.
+        """
+        if cache is not None:
+            return cache.get_key(xkey, public)
+        return BIP32Key._fromRaw(Base58.check_decode(xkey), public)
+
+    @staticmethod
+    def fromExtendedKeys(xkeys, public=False):
         """
+        Create a list of BIP32Keys from an iterable of extended key strings,
+        as fromExtendedKey() does for each.
+
+        Extended keys that occur more than once are decoded only once, but
+        each gets its own BIP32Key.
+        """
+        decoded = {}
+        keys = []
+        for xkey in xkeys:
+            raw = decoded.get(xkey)
+            if raw is None:
+                raw = decoded[xkey] = Base58.check_decode(xkey)
+            keys.append(BIP32Key._fromRaw(raw, public))
+        return keys
+
+    @staticmethod
+    def _fromRaw(raw, public):
+        "Create a BIP32Key from a decoded 78-byte extended key"
         # Sanity checks
-        raw = Base58.check_decode(xkey)
         if len(raw) != 78:
             raise ValueError("extended key format wrong length")
 
         # Verify address version/type
-        version = raw[:4]
-        if version in EX_MAIN_PRIVATE:
-            is_testnet = False
-            is_pubkey = False
-        elif version in EX_TEST_PRIVATE:
-            is_testnet = True
-            is_pubkey = False
-        elif version in EX_MAIN_PUBLIC:
-            is_testnet = False
-            is_pubkey = True
-        elif version in EX_TEST_PUBLIC:
-            is_testnet = True
-            is_pubkey = True
-        else:
+        try:
+            is_testnet, is_pubkey = EX_VERSIONS[raw[:4]]
+        except KeyError:
             raise ValueError("unknown extended key version")
 
         # Extract remaining fields
-        # Python 2.x compatibility
-        if type(raw[4]) == int:
-            depth = raw[4]
-        else:
-            depth = ord(raw[4])
+        depth = raw[4]
         fpr = raw[5:9]
         child = struct.unpack(">L", raw[9:13])[0]
         chain = raw[13:45]
@@ -94,19 +119,11 @@ class BIP32Key(object):
             secret = secret[1:]
         else:
             # Recover public curve point from compressed key
-            # Python3 FIX
-            lsb = secret[0] & 1 if type(secret[0]) == int else ord(secret[0]) & 1
-            x = string_to_int(secret[1:])
-            ys = (x**3+7) % FIELD_ORDER # y^2 = x^3 + 7 mod p
-            y = sqrt_mod(ys, FIELD_ORDER)
-            if y & 1 != lsb:
-                y = FIELD_ORDER-y
-            point = ecdsa.ellipticcurve.Point(SECP256k1.curve, x, y)
-            secret = ecdsa.VerifyingKey.from_public_point(point, curve=SECP256k1)
+            secret = secp256k1.decompress(secret)
 
         key = BIP32Key(secret=secret, chain=chain, depth=depth, index=child, fpr=fpr, public=is_pubkey, testnet=is_testnet)
         if not is_pubkey and public:
-            key = key.SetPublic()
+            key.SetPublic()
         return key
 
 
@@ -116,8 +133,9 @@ class BIP32Key(object):
         Create a public or private BIP32Key using key material and chain code.
 
         secret   This is the source material to generate the keypair, either a
-                 32-byte string representation of a private key, or the ECDSA
-                 library object representing a public key.
+                 32-byte string representation of a private key or the private
+                 exponent as an integer, or the public key as an affine (x, y)
+                 tuple or an ECDSA library object (a VerifyingKey or a Point).
 
         chain    This is a 32-byte string representation of the chain code
 
@@ -125,19 +143,38 @@ class BIP32Key(object):
 
         index    Child index
 
-        fpr      Parent fingerprint
+        fpr      Parent fingerprint, or the parent BIP32Key itself (see
+                 parent_fpr)
 
         public   If true, this keypair will only contain a public key and can only create
                  a public key chain.
+
+        The public point of a private key is only computed when it is
+        first needed, so deriving hardened children costs no curve
+        multiplications.
         """
 
         self.public = public
+        self._k = None
+        self._K = None
         if public is False:
-            self.k = ecdsa.SigningKey.from_string(secret, curve=SECP256k1)
-            self.K = self.k.get_verifying_key()
+            if not isinstance(secret, int):
+                if len(secret) != 32:
+                    raise ValueError("private key must be 32 bytes")
+                secret = int.from_bytes(secret, "big")
+            if not 0 < secret < CURVE_ORDER:
+                raise ValueError("private key out of range")
+            self.secret = secret
+            self.point = None
         else:
-            self.k = None
-            self.K = secret
+            self.secret = None
+            K = None
+            if isinstance(secret, ecdsa.VerifyingKey):
+                K, secret = secret, secret.pubkey.point
+            if not isinstance(secret, tuple):
+                secret = (secret.x(), secret.y())
+            self.point = secret
+            self._K = K
 
         self.C = chain
         self.depth = depth
@@ -146,6 +183,114 @@ class BIP32Key(object):
         self.testnet = testnet
 
 
+    @property
+    def point(self):
+        "Public key as an affine (x, y) tuple, None until computed"
+        return self._point
+
+
+    @point.setter
+    def point(self, point):
+        self._point = point
+        self._K = None
+        self._clear_caches()
+
+
+    def _clear_caches(self):
+        "Forget the memoized encodings of the public key"
+        self._cK = None
+        self._uK = None
+        self._id = None
+
+
+    @property
+    def C(self):
+        "Chain code, the HMAC-SHA512 key of child derivation"
+        return self._C
+
+
+    @C.setter
+    def C(self, chain):
+        self._C = chain
+        self._mac = None
+
+
+    def __copy__(self):
+        """
+        Return a new BIP32Key with the same key material and memoized
+        encodings, which can be converted or modified independently
+        """
+        key = BIP32Key.__new__(BIP32Key)
+        for name in self.__slots__:
+            setattr(key, name, getattr(self, name))
+        # the ecdsa objects are mutable, so they are made anew if needed
+        key._k = key._K = None
+        return key
+
+
+    def __getstate__(self):
+        # the keyed HMAC can't be pickled, it is rebuilt on first use,
+        # and the parent secret is never pickled
+        self.parent_fpr
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["_mac"] = None
+        return state
+
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+    @property
+    def parent_fpr(self):
+        "Parent fingerprint, computed from the parent secret on first use"
+        if self._parent_secret is not None:
+            point = secp256k1.multiply_base(self._parent_secret)
+            self._parent_fpr = ripemd160.hash160(secp256k1.compress(point))[:4]
+            self._parent_secret = None
+        return self._parent_fpr
+
+
+    @parent_fpr.setter
+    def parent_fpr(self, fpr):
+        """
+        Set the parent fingerprint, or take it from the parent BIP32Key.
+        No reference to the parent is kept: if its public point is not
+        computed yet (a private parent of hardened children), only its
+        secret is kept until the fingerprint is needed, SetPublic() is
+        called or the key is pickled.
+        """
+        if isinstance(fpr, BIP32Key):
+            if fpr.point is None:
+                self._parent_secret, self._parent_fpr = fpr.secret, None
+                return
+            fpr = fpr.Fingerprint()
+        self._parent_secret, self._parent_fpr = None, fpr
+
+
+    # Compatibility views of the key material as ecdsa objects,
+    # built on first use
+    #
+    @property
+    def k(self):
+        "ecdsa.SigningKey of the private key, or None for public keys"
+        if self.secret is None:
+            return None
+        if self._k is None:
+            self._k = ecdsa.SigningKey.from_secret_exponent(self.secret, curve=SECP256k1)
+        return self._k
+
+
+    @property
+    def K(self):
+        "ecdsa.VerifyingKey of the public key"
+        if self._K is None:
+            point = ecdsa.ellipticcurve.Point(SECP256k1.curve, *self.Point())
+            self._K = ecdsa.VerifyingKey.from_public_point(point, curve=SECP256k1)
+        return self._K
+
+
     # Internal methods not intended to be called externally
     #
     def hmac(self, data):
@@ -153,8 +298,15 @@ class BIP32Key(object):
         Calculate the HMAC-SHA512 of input data using the chain code as key.
 
         Returns a tuple of the left and right halves of the HMAC
-        """         
-        I = hmac.new(self.C, data, hashlib.sha512).digest()
+
+        The HMAC keyed with the chain code is made once per key and
+        copied for each message, so siblings share its key schedule.
+        """
+        if self._mac is None:
+            self._mac = hmac.new(self.C, digestmod=hashlib.sha512)
+        mac = self._mac.copy()
+        mac.update(data)
+        I = mac.digest()
         return (I[:32], I[32:])
 
 
@@ -173,24 +325,22 @@ class BIP32Key(object):
 
         # Data to HMAC
         if i & BIP32_HARDEN:
-            data = b'\0' + self.k.to_string() + i_str
+            data = b'\0' + self.PrivateKey() + i_str
         else:
             data = self.PublicKey() + i_str
         # Get HMAC of data
         (Il, Ir) = self.hmac(data)
 
         # Construct new key material from Il and current private key
-        Il_int = string_to_int(Il)
-        if Il_int > CURVE_ORDER:
+        Il_int = int.from_bytes(Il, "big")
+        if Il_int >= CURVE_ORDER:
             return None
-        pvt_int = string_to_int(self.k.to_string())
-        k_int = (Il_int + pvt_int) % CURVE_ORDER
+        k_int = (Il_int + self.secret) % CURVE_ORDER
         if (k_int == 0):
             return None
-        secret = (b'\0'*32 + int_to_string(k_int))[-32:]
-        
+
         # Construct and return a new BIP32Key
-        return BIP32Key(secret=secret, chain=Ir, depth=self.depth+1, index=i, fpr=self.Fingerprint(), public=False, testnet=self.testnet)
+        return BIP32Key(secret=k_int, chain=Ir, depth=self.depth+1, index=i, fpr=self, public=False, testnet=self.testnet)
 
 
     def CKDpub(self, i):
@@ -214,18 +364,15 @@ class BIP32Key(object):
         (Il, Ir) = self.hmac(data)
 
         # Construct curve point Il*G+K
-        Il_int = string_to_int(Il)
+        Il_int = int.from_bytes(Il, "big")
         if Il_int >= CURVE_ORDER:
             return None
-        point = Il_int*CURVE_GEN + self.K.pubkey.point
-        if point == INFINITY:
+        point = secp256k1.multiply_base_add(Il_int, self.Point())
+        if point is None:
             return None
 
-        # Retrieve public key based on curve point
-        K_i = ecdsa.VerifyingKey.from_public_point(point, curve=SECP256k1)
-
         # Construct and return a new BIP32Key
-        return BIP32Key(secret=K_i, chain=Ir, depth=self.depth+1, index=i, fpr=self.Fingerprint(), public=True, testnet=self.testnet)
+        return BIP32Key(secret=point, chain=Ir, depth=self.depth+1, index=i, fpr=self, public=True, testnet=self.testnet)
 
 
     # Public methods
@@ -245,8 +392,12 @@ class BIP32Key(object):
 
     def SetPublic(self):
         "Convert a private BIP32Key into a public one"
-        self.k = None
+        self.Point()
+        self.parent_fpr   # resolves and drops the parent secret
+        self.secret = None
+        self._k = None
         self.public = True
+        self._clear_caches()
 
 
     def PrivateKey(self):
@@ -254,22 +405,26 @@ class BIP32Key(object):
         if self.public:
             raise Exception("Publicly derived deterministic keys have no private half")
         else:
-            return self.k.to_string()
+            return self.secret.to_bytes(32, "big")
+
+
+    def Point(self):
+        "Return the public key as an affine (x, y) tuple, computing it on first use"
+        if self.point is None:
+            self.point = secp256k1.multiply_base(self.secret)
+        return self.point
 
 
     def PublicKey(self, compressed=True):
         "Return compressed public key encoding"
-        padded = (b'\0'*32 + int_to_string(self.K.pubkey.point.x()))[-32:]
-        if not compressed:
-            padded += (b'\0'*32 + int_to_string(self.K.pubkey.point.y()))[-32:]
         if compressed:
-          if self.K.pubkey.point.y() & 1:
-              ck = b'\3' + padded
-          else:
-              ck = b'\2' + padded
-        else:
-           ck = padded
-        return ck
+            if self._cK is None:
+                self._cK = secp256k1.compress(self.Point())
+            return self._cK
+        if self._uK is None:
+            x, y = self.Point()
+            self._uK = x.to_bytes(32, "big") + y.to_bytes(32, "big")
+        return self._uK
 
 
     def ChainCode(self):
@@ -279,8 +434,10 @@ class BIP32Key(object):
 
     def Identifier(self):
         "Return key identifier as string"
-        cK = self.PublicKey()
-        return hashlib.new('ripemd160', sha256(cK).digest()).digest()
+        if self._id is None:
+            cK = self.PublicKey()
+            self._id = ripemd160.hash160(cK)
+        return self._id
 
 
     def Fingerprint(self):
@@ -300,20 +457,26 @@ class BIP32Key(object):
         assert len(pk_bytes) == 33 and (pk_bytes.startswith(b"\x02") or pk_bytes.startswith(b"\x03")), \
             "Only compressed public keys are compatible with p2sh-p2wpkh addresses. " \
             "See https://github.com/bitcoin/bips/blob/master/bip-0049.mediawiki."
-        pk_hash = hashlib.new('ripemd160', sha256(pk_bytes).digest()).digest()
+        pk_hash = self.Identifier()
         push_20 = bytes.fromhex('0014')
         script_sig = push_20 + pk_hash
-        address_bytes = hashlib.new('ripemd160', sha256(script_sig).digest()).digest()
+        address_bytes = ripemd160.hash160(script_sig)
         prefix = b"\xc4" if self.testnet else b"\x05"
         return Base58.check_encode(prefix + address_bytes)
 
 
+    def P2WPKHAddress(self):
+        "Return native segwit (bech32) P2WPKH address"
+        hrp = "tb" if self.testnet else "bc"
+        return Bech32.encode(hrp, 0, self.Identifier())
+
+
     def WalletImportFormat(self):
         "Returns private key encoded for wallet import"
         if self.public:
             raise Exception("Publicly derived deterministic keys have no private half")
         addressversion = b'\x80' if not self.testnet else b'\xef'
-        raw = addressversion + self.k.to_string() + b'\x01' # Always compressed
+        raw = addressversion + self.PrivateKey() + b'\x01' # Always compressed
         return Base58.check_encode(raw)
 
 
@@ -362,6 +525,112 @@ class BIP32Key(object):
         print("     * (prv b58):  ", self.ExtendedKey(private=True, encoded=True))
 
 
+class ExtendedKeyCache(object):
+    """
+    Bounded cache of the BIP32Keys parsed by fromExtendedKey(), found by
+    the extended key string. When there are more than maxsize entries,
+    the least recently used is evicted.
+
+    Every lookup returns a copy of the cached key, so converting or
+    deriving from it never changes the cached entry.
+    """
+
+    def __init__(self, maxsize=256):
+        if maxsize < 1:
+            raise ValueError("Cache size %s is not valid" % (maxsize,))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def get_key(self, xkey, public=False):
+        "Return a BIP32Key of xkey as BIP32Key.fromExtendedKey() does"
+        with self._lock:
+            key = self._entries.get(xkey)
+            if key is not None:
+                self._entries.move_to_end(xkey)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if key is None:
+            key = BIP32Key.fromExtendedKey(xkey)
+            if key.public:
+                key.PublicKey()
+            with self._lock:
+                self._entries[xkey] = key
+                self._entries.move_to_end(xkey)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        key = key.__copy__()
+        if public and not key.public:
+            key.SetPublic()
+        return key
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        "Return a dict of the size and the hit, miss and eviction counts"
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "maxsize": self.maxsize,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit ratio": (self.hits / lookups) if lookups else 0.0}
+
+
+def derive_children(parent, indices):
+    """
+    Derive the non-hardened children of parent (a public or private
+    BIP32Key) at each index in indices, all at once.
+
+    Returns a list with, for each index, a tuple (tweak, chain, point)
+    of the child's private key tweak Il as an integer (the child secret
+    is (tweak + parent.secret) % CURVE_ORDER), its chain code, and its
+    public point as an affine (x, y) tuple; or None where the index
+    gives an invalid key.
+
+    The child points are computed together, sharing their modular
+    inversions (see secp256k1.multiply_base_add_many).
+    """
+    data = parent.PublicKey()
+    tweaks, chains = [], []
+    for i in indices:
+        if i & BIP32_HARDEN:
+            raise Exception("Cannot create a hardened child key using public child derivation")
+        (Il, Ir) = parent.hmac(data + struct.pack(">L", i))
+        Il_int = int.from_bytes(Il, "big")
+        tweaks.append(Il_int if Il_int < CURVE_ORDER else None)
+        chains.append(Ir)
+    points = secp256k1.multiply_base_add_many(tweaks, parent.Point())
+    return [None if point is None else (tweak, chain, point)
+            for (tweak, chain, point) in zip(tweaks, chains, points)]
+
+
+def derive_public_children(parent, indices):
+    """
+    Return the compressed public keys of the non-hardened children of
+    parent at each index in indices, as derive_children() does. This
+    gives the same keys as parent.ChildKey(i).PublicKey(). Where an
+    index gives an invalid key, the result is None.
+    """
+    return [None if child is None else secp256k1.compress(child[2])
+            for child in derive_children(parent, indices)]
+
+
 if __name__ == "__main__":
     import sys
 
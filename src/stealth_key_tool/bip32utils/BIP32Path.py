@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import re
+import functools
+
+from .BIP32Key import BIP32_HARDEN
+
+# One path node: an index, an inclusive range of indices or a wildcard
+# for every index, optionally hardened with h, H or '
+NODE_RE = re.compile(r"^(?:(\d+)(?:-(\d+))?|(\*))([hH']?)$")
+
+
+class BIP32Path(object):
+    """
+    A BIP32 derivation path such as m/44'/125'/0'/0/0-9999 or 0h/*/5,
+    compiled once into integer node ranges.
+
+    master   True if the path starts at a master key (m or M)
+
+    public   True if the path starts at a public master key (M)
+
+    nodes    Tuple of (first, last, hardened) per node, where first and
+             last are the inclusive range of unhardened indices
+
+    Paths with ranges or wildcards stand for every path they match.
+    These are only enumerated as they are used, by Paths() and Derive().
+    BIP32Path objects are immutable and hashable.
+    """
+
+    __slots__ = ("master", "public", "nodes")
+
+    def __init__(self, spec):
+        "Compile the path string spec, raising ValueError if it is not valid"
+        parts = spec.strip().split("/")
+        master = parts[0] in ("m", "M")
+        public = parts[0] == "M"
+        if master:
+            parts = parts[1:]
+        elif parts == [""]:
+            raise ValueError("path %r is not valid" % (spec,))
+        nodes = []
+        for part in parts:
+            match = NODE_RE.match(part)
+            if match is None:
+                raise ValueError("path %r is not valid" % (spec,))
+            first, last, star, hard = match.groups()
+            if star:
+                first, last = 0, BIP32_HARDEN - 1
+            else:
+                first = int(first)
+                last = first if last is None else int(last)
+            if not first <= last < BIP32_HARDEN:
+                raise ValueError("path %r is not valid" % (spec,))
+            nodes.append((first, last, bool(hard)))
+        object.__setattr__(self, "master", master)
+        object.__setattr__(self, "public", public)
+        object.__setattr__(self, "nodes", tuple(nodes))
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BIP32Path objects are immutable")
+
+
+    def __eq__(self, other):
+        if not isinstance(other, BIP32Path):
+            return NotImplemented
+        return ((self.master, self.public, self.nodes) ==
+                (other.master, other.public, other.nodes))
+
+
+    def __reduce__(self):
+        return (BIP32Path, (str(self),))
+
+
+    def __hash__(self):
+        return hash((self.master, self.public, self.nodes))
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def __str__(self):
+        parts = []
+        if self.master:
+            parts.append("M" if self.public else "m")
+        for (first, last, hardened) in self.nodes:
+            if (first, last) == (0, BIP32_HARDEN - 1):
+                part = "*"
+            elif first == last:
+                part = str(first)
+            else:
+                part = "%d-%d" % (first, last)
+            parts.append(part + ("'" if hardened else ""))
+        return "/".join(parts)
+
+
+    def __repr__(self):
+        return "BIP32Path(%r)" % (str(self),)
+
+
+    def IsRange(self):
+        "Return True if the path has a range or wildcard node"
+        return any(first != last for (first, last, hardened) in self.nodes)
+
+
+    def Count(self):
+        "Return the number of paths matched"
+        count = 1
+        for (first, last, hardened) in self.nodes:
+            count *= last - first + 1
+        return count
+
+
+    def Indices(self):
+        """
+        Return the child indices of a path without ranges as a tuple,
+        hardened indices including BIP32_HARDEN
+        """
+        if self.IsRange():
+            raise ValueError("path %s matches more than one path" % (self,))
+        return tuple(first + BIP32_HARDEN if hardened else first
+                     for (first, last, hardened) in self.nodes)
+
+
+    def NodeIndices(self, depth):
+        "Return an iterator over the child indices of the node at depth"
+        first, last, hardened = self.nodes[depth]
+        offset = BIP32_HARDEN if hardened else 0
+        return iter(range(first + offset, last + offset + 1))
+
+
+    def Paths(self):
+        "Yield the tuple of child indices of every path matched, in order"
+        for (indices, key) in self._walk(None, (), 0, None):
+            yield indices
+
+
+    def Derive(self, key, cache=None):
+        """
+        Yield (indices, child) for every path matched, deriving each child
+        from key. Nodes shared by several paths are derived only once.
+
+        If given, cache is a dict used to look up and keep the inner
+        (non-leaf) nodes by their tuple of indices, so that later calls
+        sharing the same cache and key can reuse them. Only the nodes
+        before the first range or wildcard are kept, so the cache does
+        not grow with the number of paths matched.
+        """
+        return self._walk(key, (), 0, cache)
+
+
+    def _walk(self, key, prefix, depth, cache):
+        if depth == len(self.nodes):
+            yield (prefix, key)
+            return
+        inner = depth + 1 < len(self.nodes)
+        first, last, hardened = self.nodes[depth]
+        if first != last:
+            # nodes below a range are only kept while they are used
+            cache = None
+        for i in self.NodeIndices(depth):
+            indices = prefix + (i,)
+            child = None
+            if key is not None:
+                if inner and cache is not None:
+                    child = cache.get(indices)
+                if child is None:
+                    child = key.ChildKey(i)
+                    if inner and cache is not None:
+                        cache[indices] = child
+            for item in self._walk(child, indices, depth + 1, cache):
+                yield item
+
+
+@functools.lru_cache(maxsize=256)
+def compile_path(spec):
+    "Return the BIP32Path of spec, compiling each distinct spec only once"
+    return BIP32Path(spec)
+
+
+def test():
+    H = BIP32_HARDEN
+    path = BIP32Path("m/44'/125h/0H/0/0-2")
+    assert path.master and not path.public
+    assert str(path) == "m/44'/125'/0'/0/0-2"
+    assert path.Count() == 3 and path.IsRange()
+    assert list(path.Paths()) == [(44 + H, 125 + H, H, 0, i) for i in range(3)]
+    assert BIP32Path("M/1/2").Indices() == (1, 2)
+    assert BIP32Path("M/1/2").public
+    star = BIP32Path("0h/*/5")
+    assert not star.master and star.Count() == H
+    assert next(iter(star.Paths())) == (H, 0, 5)
+    assert compile_path("m/0'") is compile_path("m/0'")
+    assert BIP32Path("m") == BIP32Path(" m ") and len(BIP32Path("m")) == 0
+    for bad in ("", "m/", "x/1", "m/1//2", "m/2-1", "m/-1", "m/%d" % H, "1/m"):
+        try:
+            BIP32Path(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("compiled %r" % (bad,))
+
+    from .BIP32Key import BIP32Key
+    key = BIP32Key.fromEntropy(bytes(range(32)))
+    cache = {}
+    derived = list(BIP32Path("0'/1-2/3-4").Derive(key, cache))
+    assert [indices for (indices, child) in derived] == list(
+               BIP32Path("0'/1-2/3-4").Paths())
+    for (indices, child) in derived:
+        expected = key
+        for i in indices:
+            expected = expected.ChildKey(i)
+        assert child.ExtendedKey() == expected.ExtendedKey()
+    assert sorted(cache) == [(H,)]
+    cache = {}
+    for (indices, child) in BIP32Path("1/2/*/0").Derive(key, cache):
+        if indices[2] == 500:
+            break
+    assert sorted(cache) == [(1,), (1, 2)]
+
+
+if __name__ == '__main__':
+    test()
+    print("all tests passed")
@@ -6,33 +6,57 @@
 
 from hashlib import sha256
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __base58_alphabet = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __base58_alphabet_bytes = b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __base58_radix = len(__base58_alphabet)
 
-
-def __string_to_int(data):
-    "Convert string of bytes Python integer, MSB"
-    val = 0
-   
-    # Python 2.x compatibility
-    if type(data) == str:
-        data = bytearray(data)
-
-    for (i, c) in enumerate(data[::-1]):
-        val += (256**i)*c
-    return val
+# Numbers are converted 10 digits (58^10 < 2^64) at a time, and digits
+# are written two at a time from a table of all 58*58 digit pairs
+__chunk_digits = 10
+__chunk = __base58_radix**__chunk_digits
+__digit_pairs = [a + b for a in __base58_alphabet for b in __base58_alphabet]
+# byte -> digit value, -1 where the byte is not in the alphabet
+__digit_values = [-1]*256
+for (i, c) in enumerate(__base58_alphabet_bytes):
+    __digit_values[c] = i
+# __powers[k] is 58^(10*2^k), for splitting long numbers in halves,
+# added as needed (a dict, so threads adding the same k agree)
+__powers = {0: __chunk}
+
+
+def __chunk_to_digits(val):
+    "Convert val < 58^10 to exactly 10 base58 digits"
+    pairs = __digit_pairs
+    radix2 = __base58_radix**2
+    val, d4 = divmod(val, radix2)
+    val, d3 = divmod(val, radix2)
+    val, d2 = divmod(val, radix2)
+    d0, d1 = divmod(val, radix2)
+    return pairs[d0] + pairs[d1] + pairs[d2] + pairs[d3] + pairs[d4]
+
+
+def __int_to_digits(val, k):
+    "Convert val < 58^(10*2^k) to exactly 10*2^k base58 digits"
+    if k == 0:
+        return __chunk_to_digits(val)
+    hi, lo = divmod(val, __powers[k - 1])
+    return __int_to_digits(hi, k - 1) + __int_to_digits(lo, k - 1)
 
 
 def encode(data):
     "Encode bytes into Bitcoin base58 string"
-    enc = ''
-    val = __string_to_int(data)
-    while val >= __base58_radix:
-        val, mod = divmod(val, __base58_radix)
-        enc = __base58_alphabet[mod] + enc
-    if val:
-        enc = __base58_alphabet[val] + enc
+    val = int.from_bytes(data, "big")
+    k = 0
+    while val >= __powers[k]:
+        k += 1
+        if k not in __powers:
+            __powers[k] = __powers[k - 1]**2
+    enc = __int_to_digits(val, k).lstrip(__base58_alphabet[0])
 
     # Pad for leading zeroes
     n = len(data)-len(data.lstrip(b'\0'))
@@ -45,24 +69,111 @@ def check_encode(raw):
     return encode(raw+chk)
 
 
-def decode(data):
-    "Decode Bitcoin base58 format string to bytes"
-    # Python 2.x compatability
-    if bytes != str:
-        data = bytes(data, 'ascii')
-
+# Batches are divided by 58^5 < 2^30, so a remainder shifted up by a
+# 32-bit limb still fits in a uint64
+__batch_digits = 5
+__batch_divisor = __base58_radix**__batch_digits
+
+
+def check_encode_many(payloads):
+    """
+    Encode a sequence of raw byte strings into Bitcoin base58 strings with
+    checksum, returning the same list as [check_encode(p) for p in payloads]
+
+    When NumPy is available and all payloads have the same length (e.g.
+    21-byte address or 34-byte WIF payloads), the base conversion is done
+    for the whole batch at once, dividing rows of 32-bit limbs by 58^5.
+    """
+    payloads = [bytes(p) for p in payloads]
+    if not payloads:
+        return []
+    width = len(payloads[0])
+    if (numpy is None or len(payloads) < 2 or
+            any(len(p) != width for p in payloads)):
+        return [check_encode(p) for p in payloads]
+    raw = b''.join([p + sha256(sha256(p).digest()).digest()[:4]
+                    for p in payloads])
+    n, nbytes = len(payloads), width + 4
+
+    # Rows of big-endian 32-bit limbs, zero padded at the top
+    nlimbs = (nbytes + 3)//4
+    rows = numpy.zeros((n, nlimbs*4), dtype=numpy.uint8)
+    rows[:, nlimbs*4 - nbytes:] = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(n, nbytes)
+    # limbs[j] is limb j of every row, most significant first
+    limbs = rows.view('>u4').T.astype(numpy.uint64)
+
+    # Digits, least significant first, __batch_digits per division
+    ndigits = len(encode(b'\xff'*nbytes))
+    nrounds = -(-ndigits//__batch_digits)
+    digits = numpy.empty((n, nrounds*__batch_digits), dtype=numpy.uint8)
+    divisor = numpy.uint64(__batch_divisor)
+    shift = numpy.uint64(32)
+    top = 0
+    for r in range(nrounds):
+        # limbs that are zero in every row stay zero
+        while top < nlimbs - 1 and not limbs[top].any():
+            top += 1
+        rem = numpy.zeros(n, dtype=numpy.uint64)
+        for j in range(top, nlimbs):
+            cur = (rem << shift) | limbs[j]
+            limbs[j] = cur // divisor
+            rem = cur % divisor
+        for d in range(__batch_digits):
+            rem, digit = numpy.divmod(rem, numpy.uint64(__base58_radix))
+            digits[:, -1 - (r*__batch_digits + d)] = digit
+
+    # Each row is its digits without leading zeros, after a '1' per
+    # leading zero byte. Rows are blanked up to their start and split.
+    nonzero = digits != 0
+    first = numpy.where(nonzero.any(axis=1), nonzero.argmax(axis=1), digits.shape[1])
+    zbytes = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(n, nbytes) != 0
+    zeros = numpy.where(zbytes.any(axis=1), zbytes.argmax(axis=1), nbytes)
+    start = first - zeros
+    if (start < 0).any():
+        return [check_encode(p) for p in payloads]
+    alphabet = numpy.frombuffer(__base58_alphabet_bytes, dtype=numpy.uint8)
+    chars = numpy.full((n, digits.shape[1] + 1), ord(' '), dtype=numpy.uint8)
+    chars[:, :-1] = alphabet[digits]
+    columns = numpy.arange(digits.shape[1] + 1)
+    chars[columns[None, :] < start[:, None]] = ord(' ')
+    return chars.tobytes().decode('ascii').split()
+
+
+def __decode_bytes(data):
+    "Decode base58 bytes, or return None if a byte is not in the alphabet"
+    values = __digit_values
+    radix = __base58_radix
     val = 0
-    for (i, c) in enumerate(data[::-1]):
-        val += __base58_alphabet_bytes.find(c) * (__base58_radix**i)
+    # the first chunk takes the digits left over by the others
+    start, end = 0, len(data) % __chunk_digits or __chunk_digits
+    while start < len(data):
+        chunk = 0
+        for c in data[start:end]:
+            digit = values[c]
+            if digit < 0:
+                return None
+            chunk = chunk*radix + digit
+        val = val*__chunk + chunk
+        start, end = end, end + __chunk_digits
+
+    # Restore leading zeroes
+    n = len(data)-len(data.lstrip(__base58_alphabet_bytes[:1]))
+    return b'\0'*n + val.to_bytes((val.bit_length() + 7)//8, "big")
 
-    dec = bytearray()
-    while val >= 256:
-        val, mod = divmod(val, 256)
-        dec.append(mod)
-    if val:
-        dec.append(val)
 
-    return bytes(dec[::-1])
+def decode(data):
+    """
+    Decode Bitcoin base58 format string to bytes
+
+    Raises ValueError if data has a character not in the alphabet.
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    dec = __decode_bytes(data)
+    if dec is None:
+        bad = [c for c in data if __digit_values[c] < 0][0]
+        raise ValueError("invalid base58 character %r" % chr(bad))
+    return dec
 
 
 def check_decode(enc):
@@ -75,8 +186,58 @@ def check_decode(enc):
         return raw
 
 
+# Status codes of check_decode_into()
+VALID = 0
+BAD_CHARACTER = 1
+BAD_LENGTH = 2
+BAD_CHECKSUM = 3
+BAD_VERSION = 4
+
+
+def check_decode_into(enc, buf, offset, width, versions=None):
+    """
+    Decode a Bitcoin base58 string with checksum into buf[offset:offset+width]
+    and return VALID, without raising on bad input. Otherwise the buffer is
+    left as it was and the status is the first failure found:
+
+    BAD_CHARACTER  enc has a character not in the alphabet
+    BAD_LENGTH     the payload is not width bytes
+    BAD_CHECKSUM   the checksum does not match
+    BAD_VERSION    versions is given and the payload starts with none of them
+    """
+    if isinstance(enc, str):
+        try:
+            enc = enc.encode('ascii')
+        except UnicodeEncodeError:
+            return BAD_CHARACTER
+    dec = __decode_bytes(enc)
+    if dec is None:
+        return BAD_CHARACTER
+    if len(dec) != width + 4:
+        return BAD_LENGTH
+    raw, chk = dec[:-4], dec[-4:]
+    if chk != sha256(sha256(raw).digest()).digest()[:4]:
+        return BAD_CHECKSUM
+    if versions is not None and not any(raw.startswith(v) for v in versions):
+        return BAD_VERSION
+    buf[offset:offset + width] = raw
+    return VALID
+
+
 if __name__ == '__main__':
     assert(__base58_radix == 58)
     data = b'now is the time for all good men to come to the aid of their country'
     enc = check_encode(data)
     assert(check_decode(enc) == data)
+    assert(encode(b'\0\0' + data) == '11' + encode(data))
+    assert(decode(encode(b'\0\0' + data)) == b'\0\0' + data)
+    assert(encode(b'') == '' and decode('') == b'')
+    buf = bytearray(2*len(data))
+    assert(check_decode_into(enc, buf, len(data), len(data)) == VALID)
+    assert(buf == bytes(len(data)) + data)
+    assert(check_decode_into(enc, buf, 0, len(data), [b'x']) == BAD_VERSION)
+    assert(check_decode_into(enc, buf, 0, len(data) - 1) == BAD_LENGTH)
+    assert(check_decode_into(enc[:-1] + '0', buf, 0, len(data)) == BAD_CHARACTER)
+    assert(check_decode_into(enc[:-1] + '\xe9', buf, 0, len(data)) == BAD_CHARACTER)
+    bad = enc[:-1] + ('2' if enc[-1] != '2' else '3')
+    assert(check_decode_into(bad, buf, 0, len(data)) == BAD_CHECKSUM)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Segwit address encoding, see BIP0173 (bech32, witness version 0)
+# and BIP0350 (bech32m, witness versions 1 to 16)
+
+__bech32_alphabet = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+__bech32_values = dict((c, i) for (i, c) in enumerate(__bech32_alphabet))
+__bech32_generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+
+# __bech32_table[top] is the xor of the generators selected by the
+# 5 bits shifted out of the checksum state
+__bech32_table = [0]*32
+for top in range(32):
+    for i in range(5):
+        if (top >> i) & 1:
+            __bech32_table[top] ^= __bech32_generator[i]
+
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+# hrp -> checksum state after the expanded hrp
+__hrp_states = {}
+
+
+def __polymod(values, chk=1):
+    "Return the BCH checksum state of a sequence of 5-bit values"
+    table = __bech32_table
+    for v in values:
+        chk = ((chk & 0x1ffffff) << 5 ^ v) ^ table[chk >> 25]
+    return chk
+
+
+def __hrp_expand(hrp):
+    return [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+
+
+def __convert_bits(data, frombits, tobits, pad):
+    "Regroup a sequence of frombits-bit values into tobits-bit values"
+    acc = 0
+    bits = 0
+    out = []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        if value < 0 or value >> frombits:
+            return None
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            out.append((acc >> bits) & maxv)
+    if pad:
+        if bits:
+            out.append((acc << (tobits - bits)) & maxv)
+    elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
+        return None
+    return out
+
+
+def encode(hrp, witver, witprog):
+    "Encode a segwit address from the human readable part, version and program"
+    if not 0 <= witver <= 16 or not 2 <= len(witprog) <= 40:
+        raise ValueError("invalid witness version or program length")
+    if witver == 0 and len(witprog) not in (20, 32):
+        raise ValueError("invalid witness program length for version 0")
+    const = BECH32_CONST if witver == 0 else BECH32M_CONST
+    # the program as 5-bit groups, zero padded at the end
+    ngroups = (len(witprog)*8 + 4)//5
+    val = int.from_bytes(witprog, "big") << (ngroups*5 - len(witprog)*8)
+    data = [witver] + [(val >> 5*i) & 31 for i in range(ngroups - 1, -1, -1)]
+    state = __hrp_states.get(hrp)
+    if state is None:
+        state = __hrp_states[hrp] = __polymod(__hrp_expand(hrp))
+    polymod = __polymod(data + [0]*6, state) ^ const
+    checksum = [(polymod >> 5*(5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join([__bech32_alphabet[d] for d in data + checksum])
+
+
+def decode(hrp, addr):
+    """
+    Decode a segwit address, returning (witness version, witness program)
+
+    Raises ValueError if addr is not a valid segwit address for hrp.
+    """
+    if addr.lower() != addr and addr.upper() != addr:
+        raise ValueError("mixed case segwit address")
+    addr = addr.lower()
+    pos = addr.rfind('1')
+    if pos < 1 or pos + 7 > len(addr) or len(addr) > 90 or addr[:pos] != hrp:
+        raise ValueError("invalid segwit address")
+    try:
+        data = [__bech32_values[c] for c in addr[pos + 1:]]
+    except KeyError:
+        raise ValueError("invalid bech32 character")
+    if not data[0] <= 16:
+        raise ValueError("invalid witness version")
+    const = BECH32_CONST if data[0] == 0 else BECH32M_CONST
+    if __polymod(__hrp_expand(hrp) + data) != const:
+        raise ValueError("bech32 checksum error")
+    witprog = __convert_bits(data[1:-6], 5, 8, False)
+    if witprog is None or not 2 <= len(witprog) <= 40:
+        raise ValueError("invalid witness program")
+    if data[0] == 0 and len(witprog) not in (20, 32):
+        raise ValueError("invalid witness program length for version 0")
+    return (data[0], bytes(witprog))
+
+
+if __name__ == '__main__':
+    # BIP0173 and BIP0350 test vectors
+    prog = bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')
+    assert(encode('bc', 0, prog) == 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4')
+    assert(decode('bc', 'BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4') == (0, prog))
+    prog = bytes.fromhex('79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+    assert(encode('bc', 1, prog) ==
+           'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0')
+    for bad in ('bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5',
+                'tb1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4',
+                'bc1zw508d6qejxtdg4y5r3zarvaryvqyzf3du'):
+        try:
+            decode('bc', bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(bad)
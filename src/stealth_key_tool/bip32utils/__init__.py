@@ -1 +1,3 @@
-from .BIP32Key import BIP32Key, BIP32_HARDEN
+from .BIP32Key import BIP32Key, BIP32_HARDEN, ExtendedKeyCache, derive_children, derive_public_children
+from .BIP32Path import BIP32Path, compile_path
+from .ripemd160 import hash160, hash160_many
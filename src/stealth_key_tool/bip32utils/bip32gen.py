@@ -2,7 +2,7 @@
 # See LICENSE.txt for distribution terms
 #
 
-import os, sys, argparse, re
+import os, sys, argparse
 from . import *
 
 # __main__ entrypoint at bottom
@@ -27,12 +27,12 @@ def WriteOutput(fname, prefix, data, is_hex):
    f.write(prefix+data+'\n')
 
 
-def ParseKeyspec(args, input_data, keyspec, cache):
+def DeriveKeyspec(args, input_data, path, cache):
    """
-   Create a key from key specification with common args, storing
-   intermediate keys in a cache for reuse.
-
-   Assumes keyspec format already validated with regex.
+   Yield the keys of a compiled key specification (a BIP32Path) with
+   common args, storing the starting keys and intermediate keys in a
+   cache for reuse. A keyspec with ranges or wildcards yields a key
+   for every path it matches, in order.
 
    There are three sources of input for key generation:
 
@@ -40,74 +40,45 @@ def ParseKeyspec(args, input_data, keyspec, cache):
      the master key and seed will be generated per BIP0032.
      This is one option for keyspecs starting with 'm/...' or
      'M/...'.  Keyspecs starting with 'M' result in public-
-     only keys.  From this master key, they keyspec is
-     recursively parsed to create child keys using the indices
-     found in the keyspec.
+     only keys.  From this master key, child keys are derived
+     using the indices found in the keyspec.
 
    * Supplying an extended private key, which is imported back
      into a normal key.  From this, normal or hardened child keys
-     are recursively derived using the private derivation algorithm
-     and index numbers in the keyspec.  The returned key is capable
-     of generating further normal or hardened child keys.
+     are derived using the private derivation algorithm and index
+     numbers in the keyspec.  The returned key is capable of
+     generating further normal or hardened child keys.
 
    * Supplying an extended public key, which is imported back into
-     a public-only key.  From this, public-only keys are recursively
-     derived using the public derivation algorithm and index numbers
-     in the keyspec.  The returned key does not have a private key half
+     a public-only key.  From this, public-only keys are derived
+     using the public derivation algorithm and index numbers in the
+     keyspec.  The returned key does not have a private key half
      and is only further capable of generating publicly derived child
      keys.
    """
-   key = None
-   acc = ''
-
    # Generate initial key, either from entropy, xprv, or xpub
    if args.input_type == 'entropy':
-      acc = keyspec.split('/')[0]
+      root = 'M' if path.public else 'm'
       try:
-         key = cache[acc]
+         key = cache[root]
       except KeyError:
-         public = (acc == 'M')
          entropy = input_data['entropy'].encode('utf-8')
          key = BIP32Key.fromEntropy(entropy=entropy,
-                                    public=public,
+                                    public=path.public,
                                     testnet=args.testnet)
-         cache[acc] = key
-   elif args.input_type == 'xprv':
-      try:
-         key = cache['xprv']
-      except KeyError:
-         key = BIP32Key.fromExtendedKey(input_data['xprv'])
-         cache['xprv'] = key
+         cache[root] = key
    else:
+      root = args.input_type
       try:
-         key = cache['xpub']
+         key = cache[root]
       except KeyError:
-         key = BIP32Key.fromExtendedKey(input_data['xpub'])
-         cache['xpub'] = key
-
-   # Parse nodes, build up intermediate keys
-   for node in keyspec.split('/'):
-      if node in ['m', 'M']:
-         key = cache[node]
-      else:
-         # Descendent or relative node
-         if acc == '':
-            acc = node
-         else:
-            acc = acc + '/' + node
-
-         try:
-            key = cache[acc]
-         except KeyError:
-            if key is None:
-               key = cache[args.input_type]
-            # Now generate child keys
-            i = int(node.split('h')[0])
-            if 'h' in node:
-               i = i + BIP32_HARDEN
-            key = key.ChildKey(i)
-            cache[acc] = key
-   return key
+         key = BIP32Key.fromExtendedKey(input_data[root])
+         cache[root] = key
+
+   # Derive the keys, sharing intermediate keys between keyspecs
+   nodes = cache.setdefault(root + '/', {})
+   for (indices, child) in path.Derive(key, nodes):
+      yield child
 
 
 # Input sources
@@ -126,6 +97,14 @@ def ReadEntropy(args):
    return entropy
 
 
+def ReadExtendedKey(args):
+   "Reads an extended key string from source"
+   xkey = ReadInput(args.from_file, None, False).strip()
+   if isinstance(xkey, bytes):
+      xkey = xkey.decode('ascii')
+   return xkey
+
+
 valid_output_types = ['addr','privkey','wif','pubkey','xprv','xpub','chain']
 
 def GetArgs():
@@ -150,7 +129,8 @@ def GetArgs():
    parser.add_argument('-d', '--debug', action='store_true', default=False,
                        help='enable debugging output')
    parser.add_argument('chain', nargs='+',
-                        help='list of hierarchical key specifiers')
+                        help='list of hierarchical key specifiers, where a node may be'
+                             ' a range (0-9) or a wildcard (*)')
    parser.add_argument('-t', '--testnet', action='store_true', default=False,
                        help='use testnet format')
 
@@ -174,16 +154,20 @@ def GetArgs():
          valid_output_display = '['+'|'.join(valid_output_types)+']'
          raise ValueError("output type \'%s\' is not one of %s\n" % (o, valid_output_display))
 
-   # Validate keyspecs for syntax
+   # Compile keyspecs, validating their syntax
+   args.paths = []
    for keyspec in args.chain:
-      if not re.match("^([mM]|[0-9]+h?)(/[0-9]+h?)*$", keyspec):
+      try:
+         path = compile_path(keyspec)
+      except ValueError:
          raise ValueError("chain %s is not valid\n" % keyspec)
       # If input is from entropy, keyspec must be absolute
-      elif args.input_type == 'entropy' and keyspec[0] not in 'mM':
+      if args.input_type == 'entropy' and not path.master:
          raise ValueError("When generating from entropy, keyspec must start with 'm' or 'M'")
       # Importing extended private or public keys need relative keyspecs
-      elif args.input_type in ['xpub','xprv'] and keyspec[0] in 'mM':
+      elif args.input_type in ['xpub','xprv'] and path.master:
          raise ValueError("When generating from xprv or xpub, keyspec must start with 0..9")
+      args.paths.append(path)
 
    return args
 
@@ -195,6 +179,29 @@ def ErrorExit(e):
 
 
 
+def WriteKey(args, otypes, key):
+   "Write the requested output types of a key"
+   # Output fields in command-line supplied order
+   for otype in otypes:
+      prefix = '' if not args.verbose else otype+':'+' '*(8-len(otype))
+      if otype == 'addr':
+         WriteOutput(args.to_file, prefix, key.Address(), False)
+      elif otype == 'privkey':
+         WriteOutput(args.to_file, prefix, key.PrivateKey(), args.output_hex)
+      elif otype == 'wif':
+         WriteOutput(args.to_file, prefix, key.WalletImportFormat(), False)
+      elif otype == 'pubkey':
+         WriteOutput(args.to_file, prefix, key.PublicKey(), args.output_hex)
+      elif otype == 'xprv':
+         WriteOutput(args.to_file, prefix, key.ExtendedKey(private=True, encoded=True), False)
+      elif otype == 'xpub':
+         WriteOutput(args.to_file, prefix, key.ExtendedKey(private=False, encoded=True), False)
+      elif otype == 'chain':
+         WriteOutput(args.to_file, prefix, key.ChainCode(), args.output_hex)
+   if args.verbose:
+      WriteOutput(args.to_file, '', '', False)
+
+
 def main():
    try:
       args = GetArgs()
@@ -209,11 +216,11 @@ def main():
       elif args.input_type == 'xprv':
          if args.verbose:
             print("Importing starting key from extended private key")
-         input_data['xprv'] = ReadInput(args.from_file, None, False).strip()
+         input_data['xprv'] = ReadExtendedKey(args)
       elif args.input_type == 'xpub':
          if args.verbose:
             print("Importing starting key from extended public key")
-         input_data['xpub'] = ReadInput(args.from_file, None, False).strip()
+         input_data['xpub'] = ReadExtendedKey(args)
    except Exception as e:
       ErrorExit(e)
 
@@ -221,30 +228,11 @@ def main():
    cache = {}
    otypes = args.output_type.split(',')
 
-   for keyspec in args.chain:
+   for (keyspec, path) in zip(args.chain, args.paths):
       if args.verbose:
          print("Keyspec: %s" % keyspec)
-      key = ParseKeyspec(args, input_data, keyspec, cache)
-
-      # Output fields in command-line supplied order
-      for otype in otypes:
-         prefix = '' if not args.verbose else otype+':'+' '*(8-len(otype))
-         if otype == 'addr':
-            WriteOutput(args.to_file, prefix, key.Address(), False)
-         elif otype == 'privkey':
-            WriteOutput(args.to_file, prefix, key.PrivateKey(), args.output_hex)
-         elif otype == 'wif':
-            WriteOutput(args.to_file, prefix, key.WalletImportFormat(), False)
-         elif otype == 'pubkey':
-            WriteOutput(args.to_file, prefix, key.PublicKey(), args.output_hex)
-         elif otype == 'xprv':
-            WriteOutput(args.to_file, prefix, key.ExtendedKey(private=True, encoded=True), False)
-         elif otype == 'xpub':
-            WriteOutput(args.to_file, prefix, key.ExtendedKey(private=False, encoded=True), False)
-         elif otype == 'chain':
-            WriteOutput(args.to_file, prefix, key.ChainCode(), args.output_hex)
-      if args.verbose:
-         WriteOutput(args.to_file, '', '', False)
+      for key in DeriveKeyspec(args, input_data, path, cache):
+         WriteKey(args, otypes, key)
 
 
 if __name__ == "__main__":
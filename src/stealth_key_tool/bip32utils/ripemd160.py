@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+RIPEMD-160 and HASH160 (RIPEMD-160 of SHA-256) with a choice of providers
+
+hashlib only has RIPEMD-160 if its OpenSSL does (OpenSSL 3 moved it to the
+legacy provider), so the first provider that reproduces the test vectors
+is chosen at import, in the order: "hashlib", "pycryptodome", "pure".
+"""
+
+import struct
+import hashlib
+
+from hashlib import sha256
+
+# (message, digest) from the RIPEMD-160 reference
+TEST_VECTORS = [
+    (b"", "9c1185a5c5e9fc54612808977ee8f548b2258d31"),
+    (b"a", "0bdc9d2d256b3ee9daae347be6f4dc835a467ffe"),
+    (b"abc", "8eb208f7e05d987a9b044a8e98c6b087f15a0bfc"),
+    (b"message digest", "5d0689ef49d2fae572b881b123a85ffa21595f36"),
+    (b"abcdefghijklmnopqrstuvwxyz", "f71c27109c692c1b56bbdceb5b9d2865b3708dbc"),
+    (b"abcdbcdecdefdefgefghfghighijhijkijkljklmklmnlmnomnopnopq",
+     "12a053384a9c0c88e405a06c27dcf49ada62eb2b"),
+    (b"1234567890"*8, "9b752e45573d4b39f4dbd3323cab82bf63326bfb"),
+]
+
+
+# Pure Python implementation
+#
+# The 80 steps of each of the two lines are written out, with the message
+# word, rotations and constant of every step inlined, which is about twice
+# as fast as looping over the step tables. In each step the 5 words of the
+# state are renamed rather than shifted along.
+
+_words = struct.Struct("<16L")
+
+
+def _compress(h, x):
+    "Return the chaining state h updated with the 16 message words x"
+    x0, x1, x2, x3, x4, x5, x6, x7, x8, x9, x10, x11, x12, x13, x14, x15 = x
+    a, b, c, d, e = h
+    # left line, round 1: f = b ^ c ^ d
+    a = (a + (b ^ c ^ d) + x0) & 0xffffffff
+    a = (((a << 11) | (a >> 21)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x1) & 0xffffffff
+    e = (((e << 14) | (e >> 18)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x2) & 0xffffffff
+    d = (((d << 15) | (d >> 17)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x3) & 0xffffffff
+    c = (((c << 12) | (c >> 20)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x4) & 0xffffffff
+    b = (((b << 5) | (b >> 27)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x5) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x6) & 0xffffffff
+    e = (((e << 7) | (e >> 25)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x7) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x8) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x9) & 0xffffffff
+    b = (((b << 13) | (b >> 19)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x10) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x11) & 0xffffffff
+    e = (((e << 15) | (e >> 17)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x12) & 0xffffffff
+    d = (((d << 6) | (d >> 26)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x13) & 0xffffffff
+    c = (((c << 7) | (c >> 25)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x14) & 0xffffffff
+    b = (((b << 9) | (b >> 23)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x15) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    # left line, round 2: f = (b & c) | (~b & d)
+    e = (e + ((a & b) | (~a & c)) + x7 + 0x5a827999) & 0xffffffff
+    e = (((e << 7) | (e >> 25)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x4 + 0x5a827999) & 0xffffffff
+    d = (((d << 6) | (d >> 26)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x13 + 0x5a827999) & 0xffffffff
+    c = (((c << 8) | (c >> 24)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x1 + 0x5a827999) & 0xffffffff
+    b = (((b << 13) | (b >> 19)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x10 + 0x5a827999) & 0xffffffff
+    a = (((a << 11) | (a >> 21)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x6 + 0x5a827999) & 0xffffffff
+    e = (((e << 9) | (e >> 23)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x15 + 0x5a827999) & 0xffffffff
+    d = (((d << 7) | (d >> 25)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x3 + 0x5a827999) & 0xffffffff
+    c = (((c << 15) | (c >> 17)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x12 + 0x5a827999) & 0xffffffff
+    b = (((b << 7) | (b >> 25)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x0 + 0x5a827999) & 0xffffffff
+    a = (((a << 12) | (a >> 20)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x9 + 0x5a827999) & 0xffffffff
+    e = (((e << 15) | (e >> 17)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x5 + 0x5a827999) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x2 + 0x5a827999) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x14 + 0x5a827999) & 0xffffffff
+    b = (((b << 7) | (b >> 25)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x11 + 0x5a827999) & 0xffffffff
+    a = (((a << 13) | (a >> 19)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x8 + 0x5a827999) & 0xffffffff
+    e = (((e << 12) | (e >> 20)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    # left line, round 3: f = (b | ~c) ^ d
+    d = (d + ((e | ~a) ^ b) + x3 + 0x6ed9eba1) & 0xffffffff
+    d = (((d << 11) | (d >> 21)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x10 + 0x6ed9eba1) & 0xffffffff
+    c = (((c << 13) | (c >> 19)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x14 + 0x6ed9eba1) & 0xffffffff
+    b = (((b << 6) | (b >> 26)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x4 + 0x6ed9eba1) & 0xffffffff
+    a = (((a << 7) | (a >> 25)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x9 + 0x6ed9eba1) & 0xffffffff
+    e = (((e << 14) | (e >> 18)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x15 + 0x6ed9eba1) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x8 + 0x6ed9eba1) & 0xffffffff
+    c = (((c << 13) | (c >> 19)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x1 + 0x6ed9eba1) & 0xffffffff
+    b = (((b << 15) | (b >> 17)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x2 + 0x6ed9eba1) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x7 + 0x6ed9eba1) & 0xffffffff
+    e = (((e << 8) | (e >> 24)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x0 + 0x6ed9eba1) & 0xffffffff
+    d = (((d << 13) | (d >> 19)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x6 + 0x6ed9eba1) & 0xffffffff
+    c = (((c << 6) | (c >> 26)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x13 + 0x6ed9eba1) & 0xffffffff
+    b = (((b << 5) | (b >> 27)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x11 + 0x6ed9eba1) & 0xffffffff
+    a = (((a << 12) | (a >> 20)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x5 + 0x6ed9eba1) & 0xffffffff
+    e = (((e << 7) | (e >> 25)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x12 + 0x6ed9eba1) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    # left line, round 4: f = (b & d) | (c & ~d)
+    c = (c + ((d & a) | (e & ~a)) + x1 + 0x8f1bbcdc) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x9 + 0x8f1bbcdc) & 0xffffffff
+    b = (((b << 12) | (b >> 20)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x11 + 0x8f1bbcdc) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x10 + 0x8f1bbcdc) & 0xffffffff
+    e = (((e << 15) | (e >> 17)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x0 + 0x8f1bbcdc) & 0xffffffff
+    d = (((d << 14) | (d >> 18)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x8 + 0x8f1bbcdc) & 0xffffffff
+    c = (((c << 15) | (c >> 17)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x12 + 0x8f1bbcdc) & 0xffffffff
+    b = (((b << 9) | (b >> 23)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x4 + 0x8f1bbcdc) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x13 + 0x8f1bbcdc) & 0xffffffff
+    e = (((e << 9) | (e >> 23)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x3 + 0x8f1bbcdc) & 0xffffffff
+    d = (((d << 14) | (d >> 18)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x7 + 0x8f1bbcdc) & 0xffffffff
+    c = (((c << 5) | (c >> 27)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x15 + 0x8f1bbcdc) & 0xffffffff
+    b = (((b << 6) | (b >> 26)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x14 + 0x8f1bbcdc) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x5 + 0x8f1bbcdc) & 0xffffffff
+    e = (((e << 6) | (e >> 26)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x6 + 0x8f1bbcdc) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x2 + 0x8f1bbcdc) & 0xffffffff
+    c = (((c << 12) | (c >> 20)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    # left line, round 5: f = b ^ (c | ~d)
+    b = (b + (c ^ (d | ~e)) + x4 + 0xa953fd4e) & 0xffffffff
+    b = (((b << 9) | (b >> 23)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x0 + 0xa953fd4e) & 0xffffffff
+    a = (((a << 15) | (a >> 17)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x5 + 0xa953fd4e) & 0xffffffff
+    e = (((e << 5) | (e >> 27)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x9 + 0xa953fd4e) & 0xffffffff
+    d = (((d << 11) | (d >> 21)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x7 + 0xa953fd4e) & 0xffffffff
+    c = (((c << 6) | (c >> 26)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x12 + 0xa953fd4e) & 0xffffffff
+    b = (((b << 8) | (b >> 24)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x2 + 0xa953fd4e) & 0xffffffff
+    a = (((a << 13) | (a >> 19)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x10 + 0xa953fd4e) & 0xffffffff
+    e = (((e << 12) | (e >> 20)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x14 + 0xa953fd4e) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x1 + 0xa953fd4e) & 0xffffffff
+    c = (((c << 12) | (c >> 20)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x3 + 0xa953fd4e) & 0xffffffff
+    b = (((b << 13) | (b >> 19)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x8 + 0xa953fd4e) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x11 + 0xa953fd4e) & 0xffffffff
+    e = (((e << 11) | (e >> 21)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x6 + 0xa953fd4e) & 0xffffffff
+    d = (((d << 8) | (d >> 24)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x15 + 0xa953fd4e) & 0xffffffff
+    c = (((c << 5) | (c >> 27)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x13 + 0xa953fd4e) & 0xffffffff
+    b = (((b << 6) | (b >> 26)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    left = (a, b, c, d, e)
+    a, b, c, d, e = h
+    # right line, round 1: f = b ^ (c | ~d)
+    a = (a + (b ^ (c | ~d)) + x5 + 0x50a28be6) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x14 + 0x50a28be6) & 0xffffffff
+    e = (((e << 9) | (e >> 23)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x7 + 0x50a28be6) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x0 + 0x50a28be6) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x9 + 0x50a28be6) & 0xffffffff
+    b = (((b << 13) | (b >> 19)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x2 + 0x50a28be6) & 0xffffffff
+    a = (((a << 15) | (a >> 17)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x11 + 0x50a28be6) & 0xffffffff
+    e = (((e << 15) | (e >> 17)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x4 + 0x50a28be6) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x13 + 0x50a28be6) & 0xffffffff
+    c = (((c << 7) | (c >> 25)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x6 + 0x50a28be6) & 0xffffffff
+    b = (((b << 7) | (b >> 25)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x15 + 0x50a28be6) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ (b | ~c)) + x8 + 0x50a28be6) & 0xffffffff
+    e = (((e << 11) | (e >> 21)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ (a | ~b)) + x1 + 0x50a28be6) & 0xffffffff
+    d = (((d << 14) | (d >> 18)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ (e | ~a)) + x10 + 0x50a28be6) & 0xffffffff
+    c = (((c << 14) | (c >> 18)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ (d | ~e)) + x3 + 0x50a28be6) & 0xffffffff
+    b = (((b << 12) | (b >> 20)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ (c | ~d)) + x12 + 0x50a28be6) & 0xffffffff
+    a = (((a << 6) | (a >> 26)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    # right line, round 2: f = (b & d) | (c & ~d)
+    e = (e + ((a & c) | (b & ~c)) + x6 + 0x5c4dd124) & 0xffffffff
+    e = (((e << 9) | (e >> 23)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x11 + 0x5c4dd124) & 0xffffffff
+    d = (((d << 13) | (d >> 19)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x3 + 0x5c4dd124) & 0xffffffff
+    c = (((c << 15) | (c >> 17)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x7 + 0x5c4dd124) & 0xffffffff
+    b = (((b << 7) | (b >> 25)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x0 + 0x5c4dd124) & 0xffffffff
+    a = (((a << 12) | (a >> 20)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x13 + 0x5c4dd124) & 0xffffffff
+    e = (((e << 8) | (e >> 24)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x5 + 0x5c4dd124) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x10 + 0x5c4dd124) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x14 + 0x5c4dd124) & 0xffffffff
+    b = (((b << 7) | (b >> 25)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x15 + 0x5c4dd124) & 0xffffffff
+    a = (((a << 7) | (a >> 25)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x8 + 0x5c4dd124) & 0xffffffff
+    e = (((e << 12) | (e >> 20)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & b) | (a & ~b)) + x12 + 0x5c4dd124) & 0xffffffff
+    d = (((d << 7) | (d >> 25)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & a) | (e & ~a)) + x4 + 0x5c4dd124) & 0xffffffff
+    c = (((c << 6) | (c >> 26)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & e) | (d & ~e)) + x9 + 0x5c4dd124) & 0xffffffff
+    b = (((b << 15) | (b >> 17)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & d) | (c & ~d)) + x1 + 0x5c4dd124) & 0xffffffff
+    a = (((a << 13) | (a >> 19)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & c) | (b & ~c)) + x2 + 0x5c4dd124) & 0xffffffff
+    e = (((e << 11) | (e >> 21)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    # right line, round 3: f = (b | ~c) ^ d
+    d = (d + ((e | ~a) ^ b) + x15 + 0x6d703ef3) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x5 + 0x6d703ef3) & 0xffffffff
+    c = (((c << 7) | (c >> 25)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x1 + 0x6d703ef3) & 0xffffffff
+    b = (((b << 15) | (b >> 17)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x3 + 0x6d703ef3) & 0xffffffff
+    a = (((a << 11) | (a >> 21)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x7 + 0x6d703ef3) & 0xffffffff
+    e = (((e << 8) | (e >> 24)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x14 + 0x6d703ef3) & 0xffffffff
+    d = (((d << 6) | (d >> 26)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x6 + 0x6d703ef3) & 0xffffffff
+    c = (((c << 6) | (c >> 26)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x9 + 0x6d703ef3) & 0xffffffff
+    b = (((b << 14) | (b >> 18)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x11 + 0x6d703ef3) & 0xffffffff
+    a = (((a << 12) | (a >> 20)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x8 + 0x6d703ef3) & 0xffffffff
+    e = (((e << 13) | (e >> 19)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x12 + 0x6d703ef3) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d | ~e) ^ a) + x2 + 0x6d703ef3) & 0xffffffff
+    c = (((c << 14) | (c >> 18)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c | ~d) ^ e) + x10 + 0x6d703ef3) & 0xffffffff
+    b = (((b << 13) | (b >> 19)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b | ~c) ^ d) + x0 + 0x6d703ef3) & 0xffffffff
+    a = (((a << 13) | (a >> 19)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a | ~b) ^ c) + x4 + 0x6d703ef3) & 0xffffffff
+    e = (((e << 7) | (e >> 25)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e | ~a) ^ b) + x13 + 0x6d703ef3) & 0xffffffff
+    d = (((d << 5) | (d >> 27)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    # right line, round 4: f = (b & c) | (~b & d)
+    c = (c + ((d & e) | (~d & a)) + x8 + 0x7a6d76e9) & 0xffffffff
+    c = (((c << 15) | (c >> 17)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x6 + 0x7a6d76e9) & 0xffffffff
+    b = (((b << 5) | (b >> 27)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x4 + 0x7a6d76e9) & 0xffffffff
+    a = (((a << 8) | (a >> 24)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x1 + 0x7a6d76e9) & 0xffffffff
+    e = (((e << 11) | (e >> 21)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x3 + 0x7a6d76e9) & 0xffffffff
+    d = (((d << 14) | (d >> 18)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x11 + 0x7a6d76e9) & 0xffffffff
+    c = (((c << 14) | (c >> 18)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x15 + 0x7a6d76e9) & 0xffffffff
+    b = (((b << 6) | (b >> 26)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x0 + 0x7a6d76e9) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x5 + 0x7a6d76e9) & 0xffffffff
+    e = (((e << 6) | (e >> 26)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x12 + 0x7a6d76e9) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x2 + 0x7a6d76e9) & 0xffffffff
+    c = (((c << 12) | (c >> 20)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + ((c & d) | (~c & e)) + x13 + 0x7a6d76e9) & 0xffffffff
+    b = (((b << 9) | (b >> 23)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + ((b & c) | (~b & d)) + x9 + 0x7a6d76e9) & 0xffffffff
+    a = (((a << 12) | (a >> 20)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + ((a & b) | (~a & c)) + x7 + 0x7a6d76e9) & 0xffffffff
+    e = (((e << 5) | (e >> 27)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + ((e & a) | (~e & b)) + x10 + 0x7a6d76e9) & 0xffffffff
+    d = (((d << 15) | (d >> 17)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + ((d & e) | (~d & a)) + x14 + 0x7a6d76e9) & 0xffffffff
+    c = (((c << 8) | (c >> 24)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    # right line, round 5: f = b ^ c ^ d
+    b = (b + (c ^ d ^ e) + x12) & 0xffffffff
+    b = (((b << 8) | (b >> 24)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x15) & 0xffffffff
+    a = (((a << 5) | (a >> 27)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x10) & 0xffffffff
+    e = (((e << 12) | (e >> 20)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x4) & 0xffffffff
+    d = (((d << 9) | (d >> 23)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x1) & 0xffffffff
+    c = (((c << 12) | (c >> 20)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x5) & 0xffffffff
+    b = (((b << 5) | (b >> 27)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x8) & 0xffffffff
+    a = (((a << 14) | (a >> 18)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x7) & 0xffffffff
+    e = (((e << 6) | (e >> 26)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x6) & 0xffffffff
+    d = (((d << 8) | (d >> 24)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x2) & 0xffffffff
+    c = (((c << 13) | (c >> 19)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x13) & 0xffffffff
+    b = (((b << 6) | (b >> 26)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    a = (a + (b ^ c ^ d) + x14) & 0xffffffff
+    a = (((a << 5) | (a >> 27)) + e) & 0xffffffff; c = ((c << 10) | (c >> 22)) & 0xffffffff
+    e = (e + (a ^ b ^ c) + x0) & 0xffffffff
+    e = (((e << 15) | (e >> 17)) + d) & 0xffffffff; b = ((b << 10) | (b >> 22)) & 0xffffffff
+    d = (d + (e ^ a ^ b) + x3) & 0xffffffff
+    d = (((d << 13) | (d >> 19)) + c) & 0xffffffff; a = ((a << 10) | (a >> 22)) & 0xffffffff
+    c = (c + (d ^ e ^ a) + x9) & 0xffffffff
+    c = (((c << 11) | (c >> 21)) + b) & 0xffffffff; e = ((e << 10) | (e >> 22)) & 0xffffffff
+    b = (b + (c ^ d ^ e) + x11) & 0xffffffff
+    b = (((b << 11) | (b >> 21)) + a) & 0xffffffff; d = ((d << 10) | (d >> 22)) & 0xffffffff
+    right = (a, b, c, d, e)
+    al, bl, cl, dl, el = left
+    ar, br, cr, dr, er = right
+    h0, h1, h2, h3, h4 = h
+    return ((h1 + cl + dr) & 0xffffffff, (h2 + dl + er) & 0xffffffff,
+            (h3 + el + ar) & 0xffffffff, (h4 + al + br) & 0xffffffff,
+            (h0 + bl + cr) & 0xffffffff)
+
+
+def ripemd160_pure(data):
+    "Return the RIPEMD-160 digest of data, in pure Python"
+    data = bytes(data)
+    pad = b"\x80" + b"\0"*((55 - len(data)) % 64)
+    data += pad + struct.pack("<Q", (len(data)*8) & 0xffffffffffffffff)
+    h = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0)
+    unpack = _words.unpack_from
+    for offset in range(0, len(data), 64):
+        h = _compress(h, unpack(data, offset))
+    return struct.pack("<5L", *h)
+
+
+# Providers
+#
+# copying an empty hash object skips the lookup of the name by hashlib.new()
+try:
+    _hashlib_empty = hashlib.new("ripemd160")
+except ValueError:
+    _hashlib_empty = None
+
+try:
+    from Crypto.Hash import RIPEMD160 as _pycryptodome
+except ImportError:
+    _pycryptodome = None
+
+
+def ripemd160_hashlib(data):
+    "Return the RIPEMD-160 digest of data, with hashlib"
+    h = _hashlib_empty.copy()
+    h.update(data)
+    return h.digest()
+
+
+def ripemd160_pycryptodome(data):
+    "Return the RIPEMD-160 digest of data, with pycryptodome"
+    return _pycryptodome.new(data).digest()
+
+
+# name -> function(data) -> digest, in order of preference
+_providers = {}
+# name -> result of verify_provider(), filled in lazily
+_verified = {}
+_active = None
+_ripemd160 = None
+
+
+def verify_provider(function):
+    "Return True if function reproduces the RIPEMD-160 test vectors"
+    try:
+        for (message, digest) in TEST_VECTORS:
+            if function(message).hex() != digest:
+                return False
+    except Exception:
+        return False
+    return True
+
+
+def _is_verified(name):
+    if name not in _verified:
+        _verified[name] = verify_provider(_providers[name])
+    return _verified[name]
+
+
+def register_provider(name, function):
+    """
+    Add a provider, a function of bytes returning the 20-byte digest.
+    The provider is verified against the test vectors when selected.
+    """
+    _providers[name] = function
+    _verified.pop(name, None)
+
+
+def set_provider(name):
+    """
+    Select the provider used by ripemd160() and the hash160 functions.
+    Raises ValueError if name is unknown or fails the test vectors.
+    """
+    global _active, _ripemd160
+    if name not in _providers:
+        raise ValueError("unknown ripemd160 provider %r" % (name,))
+    if not _is_verified(name):
+        raise ValueError("ripemd160 provider %r failed verification" % (name,))
+    _active, _ripemd160 = name, _providers[name]
+
+
+def get_provider():
+    "Return the name of the active provider"
+    return _active
+
+
+def available_providers():
+    "Return the names of all providers that pass verification"
+    return [name for name in _providers if _is_verified(name)]
+
+
+def _select_default():
+    # the slower providers are only verified if nothing faster is usable
+    for name in _providers:
+        if _is_verified(name):
+            set_provider(name)
+            return
+    raise RuntimeError("no ripemd160 provider passes verification")
+
+
+register_provider("hashlib", ripemd160_hashlib)
+register_provider("pycryptodome", ripemd160_pycryptodome)
+register_provider("pure", ripemd160_pure)
+_select_default()
+
+
+def ripemd160(data):
+    "Return the RIPEMD-160 digest of data"
+    return _ripemd160(data)
+
+
+def hash160(data):
+    "Return RIPEMD-160(SHA-256(data)), the hash of keys in addresses"
+    return _ripemd160(sha256(data).digest())
+
+
+def hash160_many(items):
+    "Return [hash160(data) for data in items], with the provider looked up once"
+    rmd = _ripemd160
+    return [rmd(sha256(data).digest()) for data in items]
+
+
+def test():
+    available = available_providers()
+    assert "pure" in available and get_provider() == available[0]
+    # all lengths around the padding boundary and multi-block messages
+    for n in list(range(50, 70)) + [119, 120, 128, 1000]:
+        message = (bytes(range(256))*4)[:n]
+        digests = set(_providers[name](message) for name in available)
+        assert len(digests) == 1, n
+    key = bytes.fromhex("0339a36013301597daef41fbe593a02cc513d0b55527ec2df1050e2e8ff49c85c2")
+    digest = "3442193e1bb70916e914552172cd4e2dbc9df811"
+    assert hash160(key).hex() == digest
+    assert hash160_many([key, b""]) == [hash160(key), hash160(b"")]
+    active = get_provider()
+    try:
+        set_provider("pure")
+        assert get_provider() == "pure" and hash160(key).hex() == digest
+    finally:
+        set_provider(active)
+    global _providers, _verified
+    register_provider("broken", lambda data: bytes(20))
+    try:
+        for name in ("md5", "broken"):
+            try:
+                set_provider(name)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("selected provider %r" % (name,))
+        assert "broken" not in available_providers()
+        assert _verified["broken"] is False
+        # with no provider that verifies, none is selected
+        providers, verified = _providers, _verified
+        _providers, _verified = {"broken": providers["broken"]}, {}
+        try:
+            _select_default()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("selected a broken provider")
+        finally:
+            _providers, _verified = providers, verified
+    finally:
+        del _providers["broken"], _verified["broken"]
+    assert get_provider() == active
+
+
+def bench(n=2000):
+    import timeit
+    data = bytes(33)
+    for name in available_providers():
+        function = _providers[name]
+        t = min(timeit.repeat(lambda: function(data), number=n//10, repeat=10))
+        print("%-14s %8.2f us" % (name, t/(n//10)*1e6))
+
+
+if __name__ == "__main__":
+    import sys
+    test()
+    print("all tests passed, using %s" % (get_provider(),))
+    if "bench" in sys.argv[1:]:
+        bench()
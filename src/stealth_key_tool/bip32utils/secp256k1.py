@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""
+Arithmetic on the secp256k1 curve y^2 = x^3 + 7 (mod P).
+
+Affine points are (x, y) tuples of ints, and None is the point at
+infinity.  Internally, points are kept in Jacobian coordinates
+(X, Y, Z), standing for (X/Z^2, Y/Z^3), so that additions need no
+modular inversion; a single pow(z, -1, P) converts back to affine.
+
+Multiples of the generator G use a fixed-base window table: G is
+precomputed times d * 2^(WINDOW*i) for every digit d and window i, so
+that k*G is just one table lookup and mixed addition per window of k.
+The table is built on first use.
+
+Multiples of other points use the GLV endomorphism (x, y) -> (BETA*x, y),
+which multiplies a point by LAMBDA: k is split into k1 + k2*LAMBDA with
+k1 and k2 of about 128 bits, and both halves are evaluated together in
+width-WNAF_WIDTH non-adjacent form, halving the number of doublings.
+"""
+
+P  = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N  = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+B  = 7
+Gx = 0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
+Gy = 0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8
+G  = (Gx, Gy)
+
+# GLV endomorphism: LAMBDA*(x, y) == (BETA*x, y), and the short basis
+# (A1, B1), (A2, B2) of the lattice of (a, b) with a + b*LAMBDA == 0 mod N
+BETA   = 0x7AE96A2B657C07106E64479EAC3434E99CF0497512F58995C1396C28719501EE
+LAMBDA = 0x5363AD4CC05C30E0A5261C028812645A122E22EA20816678DF02967C1B23BD72
+A1 =  0x3086D221A7D46BCDE86C90E49284EB15
+B1 = -0xE4437ED6010E88286F547FA90ABFE4C3
+A2 =  0x114CA50F7A8E2F3F657C1108D9D44CFD8
+B2 =  A1
+
+WINDOW = 8                               # bits of the scalar per table row
+WNAF_WIDTH = 5                           # width of the variable-base wNAF
+_WINDOWS = -(-256 // WINDOW)             # rows in the table
+_DIGITS = 1 << WINDOW                    # digit values per row
+_table = None
+
+
+def is_on_curve(point):
+    "Return True if the affine point lies on the curve"
+    if point is None:
+        return True
+    x, y = point
+    return 0 <= x < P and 0 <= y < P and (y*y - x*x*x - B) % P == 0
+
+
+# Jacobian arithmetic; None is the point at infinity
+#
+def _double(p1):
+    if p1 is None:
+        return None
+    x1, y1, z1 = p1
+    if y1 == 0:
+        return None
+    ysq = y1*y1 % P
+    s = 4*x1*ysq % P
+    m = 3*x1*x1 % P
+    x3 = (m*m - 2*s) % P
+    y3 = (m*(s - x3) - 8*ysq*ysq) % P
+    z3 = 2*y1*z1 % P
+    return (x3, y3, z3)
+
+
+def _add_mixed(p1, q):
+    "Jacobian p1 plus affine q"
+    if q is None:
+        return p1
+    if p1 is None:
+        return (q[0], q[1], 1)
+    x1, y1, z1 = p1
+    x2, y2 = q
+    z1z1 = z1*z1 % P
+    h = (x2*z1z1 - x1) % P
+    r = (y2*z1*z1z1 - y1) % P
+    if h == 0:
+        return _double(p1) if r == 0 else None
+    hh = h*h % P
+    hhh = h*hh % P
+    v = x1*hh % P
+    x3 = (r*r - hhh - 2*v) % P
+    y3 = (r*(v - x3) - y1*hhh) % P
+    z3 = z1*h % P
+    return (x3, y3, z3)
+
+
+def _add(p1, p2):
+    "Jacobian p1 plus Jacobian p2"
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    z1z1 = z1*z1 % P
+    z2z2 = z2*z2 % P
+    u1 = x1*z2z2 % P
+    s1 = y1*z2*z2z2 % P
+    h = (x2*z1z1 - u1) % P
+    r = (y2*z1*z1z1 - s1) % P
+    if h == 0:
+        return _double(p1) if r == 0 else None
+    hh = h*h % P
+    hhh = h*hh % P
+    v = u1*hh % P
+    x3 = (r*r - hhh - 2*v) % P
+    y3 = (r*(v - x3) - s1*hhh) % P
+    z3 = z1*z2*h % P
+    return (x3, y3, z3)
+
+
+def _to_affine(p1):
+    if p1 is None:
+        return None
+    x1, y1, z1 = p1
+    zi = pow(z1, -1, P)
+    zi2 = zi*zi % P
+    return (x1*zi2 % P, y1*zi2*zi % P)
+
+
+def _batch_inverse(values):
+    "Return the inverses mod P of nonzero values, with one pow() (Montgomery's trick)"
+    prefix = [0]*len(values)
+    acc = 1
+    for i, v in enumerate(values):
+        prefix[i] = acc
+        acc = acc*v % P
+    inv = pow(acc, -1, P)
+    result = [0]*len(values)
+    for i in range(len(values) - 1, -1, -1):
+        result[i] = inv*prefix[i] % P
+        inv = inv*values[i] % P
+    return result
+
+
+def _batch_to_affine(points):
+    "Convert a list of Jacobian points to affine with one shared inversion"
+    zs = [p1[2] for p1 in points if p1 is not None]
+    zis = iter(_batch_inverse(zs))
+    result = []
+    for p1 in points:
+        if p1 is None:
+            result.append(None)
+            continue
+        x1, y1, z1 = p1
+        zi = next(zis)
+        zi2 = zi*zi % P
+        result.append((x1*zi2 % P, y1*zi2*zi % P))
+    return result
+
+
+# Fixed-base multiplication
+#
+def _build_table():
+    "table[i][d] = d * 2^(WINDOW*i) * G, affine, for d in 1.._DIGITS-1"
+    table = []
+    base = G
+    for i in range(_WINDOWS):
+        row = []
+        acc = (base[0], base[1], 1)
+        for d in range(1, _DIGITS):
+            row.append(acc)
+            acc = _add_mixed(acc, base)
+        # acc is now _DIGITS * base, the base of the next row
+        row = _batch_to_affine(row + [acc])
+        base = row.pop()
+        table.append([None] + row)
+    return table
+
+
+def _multiply_base_jacobian(k):
+    global _table
+    if _table is None:
+        _table = _build_table()
+    k %= N
+    mask = _DIGITS - 1
+    acc = None
+    for row in _table:
+        if k == 0:
+            break
+        d = k & mask
+        if d:
+            acc = _add_mixed(acc, row[d])
+        k >>= WINDOW
+    return acc
+
+
+def multiply_base(k):
+    "Return k*G as an affine point"
+    return _to_affine(_multiply_base_jacobian(k))
+
+
+def multiply_base_add(k, point):
+    "Return k*G + point as an affine point, with a single inversion"
+    return _to_affine(_add_mixed(_multiply_base_jacobian(k), point))
+
+
+def multiply_base_add_many(ks, point):
+    """
+    Return [k*G + point for k in ks] as affine points. Where k is None,
+    so is the result.
+
+    All sums are accumulated in affine coordinates one table row at a
+    time, and the slopes of each row's additions share one inversion
+    (Montgomery's trick), which makes an affine addition cheaper than a
+    Jacobian one. The rare sums that would need a doubling or reach
+    infinity are redone one at a time.
+    """
+    global _table
+    if _table is None:
+        _table = _build_table()
+    ks = list(ks)
+    n = len(ks)
+    results = [None]*n
+    if point is None:
+        return [None if k is None else multiply_base(k) for k in ks]
+    active = [j for j in range(n) if ks[j] is not None]
+    rest = {j: ks[j] % N for j in active}
+    xs = {j: point[0] for j in active}
+    ys = {j: point[1] for j in active}
+    exceptions = []
+    mask = _DIGITS - 1
+    for row in _table:
+        lanes = []
+        for j in active:
+            d = rest[j] & mask
+            rest[j] >>= WINDOW
+            if d:
+                q = row[d]
+                if q[0] == xs[j]:
+                    exceptions.append(j)
+                else:
+                    lanes.append((j, q))
+        if exceptions:
+            gone = set(exceptions)
+            active = [j for j in active if j not in gone]
+            lanes = [(j, q) for (j, q) in lanes if j not in gone]
+        invs = _batch_inverse([(q[0] - xs[j]) % P for (j, q) in lanes])
+        for (j, (x2, y2)), inv in zip(lanes, invs):
+            x1, y1 = xs[j], ys[j]
+            lam = (y2 - y1)*inv % P
+            x3 = (lam*lam - x1 - x2) % P
+            ys[j] = (lam*(x1 - x3) - y1) % P
+            xs[j] = x3
+    for j in active:
+        results[j] = (xs[j], ys[j])
+    for j in set(exceptions):
+        results[j] = multiply_base_add(ks[j], point)
+    return results
+
+
+# Variable-base multiplication and addition
+#
+def _split_scalar(k):
+    "Return (k1, k2) with k == k1 + k2*LAMBDA (mod N), both about 128 bits"
+    c1 = (B2*k + N//2) // N
+    c2 = (-B1*k + N//2) // N
+    k1 = k - c1*A1 - c2*A2
+    k2 = -c1*B1 - c2*B2
+    return k1, k2
+
+
+def _wnaf(k, width):
+    "Return the width-w non-adjacent form of k >= 0, least significant digit first"
+    digits = []
+    full = 1 << width
+    half = full >> 1
+    while k:
+        if k & 1:
+            d = k & (full - 1)
+            if d >= half:
+                d -= full
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+    return digits
+
+
+def _odd_multiples(point, count):
+    "Return [P, 3P, 5P, ...] (count points), affine"
+    p1 = (point[0], point[1], 1)
+    twice = _to_affine(_double(p1))
+    multiples = [p1]
+    for i in range(count - 1):
+        multiples.append(_add_mixed(multiples[-1], twice))
+    return _batch_to_affine(multiples)
+
+
+def _signed_table(multiples):
+    "Map odd d (negative ones from the end) to d*P, given [P, 3P, 5P, ...]"
+    table = [None]*(4*len(multiples))
+    for i, (x, y) in enumerate(multiples):
+        table[2*i + 1] = (x, y)
+        table[-(2*i + 1)] = (x, P - y)
+    return table
+
+
+def multiply(k, point):
+    "Return k*point as an affine point, using GLV and wNAF"
+    k %= N
+    if (k == 0) or (point is None):
+        return None
+    k1, k2 = _split_scalar(k)
+    table1 = _odd_multiples(point, 1 << (WNAF_WIDTH - 2))
+    if None in table1:
+        # only possible for points of small order, i.e. not on this curve
+        raise ValueError("point is not on secp256k1")
+    # LAMBDA times each multiple costs one field multiplication
+    table2 = [(BETA*x % P, y) for (x, y) in table1]
+    if k1 < 0:
+        k1, table1 = -k1, [(x, P - y) for (x, y) in table1]
+    if k2 < 0:
+        k2, table2 = -k2, [(x, P - y) for (x, y) in table2]
+    # index by digit: table[d] is d times the base, for odd -2^w < d < 2^w
+    table1 = _signed_table(table1)
+    table2 = _signed_table(table2)
+    naf1 = _wnaf(k1, WNAF_WIDTH)
+    naf2 = _wnaf(k2, WNAF_WIDTH)
+    n = max(len(naf1), len(naf2))
+    naf1 += [0]*(n - len(naf1))
+    naf2 += [0]*(n - len(naf2))
+    acc = None
+    for i in range(n - 1, -1, -1):
+        acc = _double(acc)
+        d = naf1[i]
+        if d:
+            acc = _add_mixed(acc, table1[d])
+        d = naf2[i]
+        if d:
+            acc = _add_mixed(acc, table2[d])
+    return _to_affine(acc)
+
+
+def add(point1, point2):
+    "Return point1 + point2 as an affine point"
+    if point1 is None:
+        return point2
+    return _to_affine(_add_mixed((point1[0], point1[1], 1), point2))
+
+
+def compress(point):
+    "Return the 33-byte compressed encoding of an affine point"
+    x, y = point
+    return (b'\3' if y & 1 else b'\2') + x.to_bytes(32, "big")
+
+
+def decompress(data):
+    """
+    Return the affine point of a 33-byte compressed encoding. Raises
+    ValueError if the encoding is malformed or x is not on the curve.
+
+    P = 3 (mod 4), so a square root of a is a^((P+1)/4), if a has one.
+    """
+    if len(data) != 33 or data[0] not in (2, 3):
+        raise ValueError("not a compressed point")
+    x = int.from_bytes(data[1:], "big")
+    if x >= P:
+        raise ValueError("point not on curve")
+    ys = (x*x*x + B) % P
+    y = pow(ys, (P + 1)//4, P)
+    if y*y % P != ys:
+        raise ValueError("point not on curve")
+    if (y & 1) != (data[0] & 1):
+        y = P - y
+    return (x, y)
+
+
+def negate(point):
+    "Return -point"
+    if point is None:
+        return None
+    return (point[0], (-point[1]) % P)
+
+
+def test():
+    import random
+    from ecdsa.ecdsa import generator_secp256k1 as ecdsa_g
+    def from_ecdsa(pt):
+        pt = pt.to_affine() if hasattr(pt, "to_affine") else pt
+        return (pt.x(), pt.y())
+    assert is_on_curve(G)
+    assert (ecdsa_g.order(), ecdsa_g.curve().p()) == (N, P)
+    assert multiply_base(1) == G
+    assert multiply_base(N) is None
+    assert multiply_base(N - 1) == negate(G)
+    assert add(G, negate(G)) is None
+    assert add(G, G) == multiply_base(2)
+    rnd = random.Random(1)
+    for i in range(50):
+        k = rnd.randrange(1, N)
+        j = rnd.randrange(1, N)
+        kG = multiply_base(k)
+        assert kG == from_ecdsa(k*ecdsa_g)
+        assert is_on_curve(kG)
+        assert multiply(j, kG) == from_ecdsa((j*k % N)*ecdsa_g)
+        assert multiply_base_add(j, kG) == from_ecdsa(((j + k) % N)*ecdsa_g)
+    points = [(G[0], G[1], 1), None, _double((G[0], G[1], 1))]
+    assert _batch_to_affine(points) == [G, None, multiply_base(2)]
+    assert (pow(LAMBDA, 3, N), pow(BETA, 3, P)) == (1, 1)
+    assert multiply_base(LAMBDA) == (BETA*Gx % P, Gy)
+    for k in [1, 2, LAMBDA, N - 1, (N - 1)//2] + [rnd.randrange(N) for i in range(50)]:
+        k1, k2 = _split_scalar(k)
+        assert (k1 + k2*LAMBDA - k) % N == 0
+        assert max(abs(k1), abs(k2)).bit_length() <= 129
+        assert sum(d << i for i, d in enumerate(_wnaf(k, WNAF_WIDTH))) == k
+        assert multiply(k, G) == multiply_base(k)
+    assert multiply(N, G) is None
+    ks = [1, None, N - 1, 5, N - 2, 0, 256] + [rnd.randrange(N) for i in range(20)]
+    assert multiply_base_add_many(ks, G) == [None if k is None else
+                                             multiply_base_add(k, G) for k in ks]
+    assert compress(G).hex() == \
+        "0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"
+    for k in (1, 2, 3, N - 1):
+        assert decompress(compress(multiply_base(k))) == multiply_base(k)
+    for bad in (b'\2' + bytes(32), b'\4' + bytes(32), b'\2' + P.to_bytes(32, "big")):
+        try:
+            decompress(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("decompressed %s" % bad.hex())
+
+
+def bench(n=200):
+    "Compare variable-base multiplication with ecdsa's"
+    import time
+    import random
+    from ecdsa.curves import SECP256k1
+    from ecdsa.ellipticcurve import PointJacobi
+    rnd = random.Random(2)
+    ks = [rnd.randrange(1, N) for i in range(n)]
+    point = multiply_base(rnd.randrange(1, N))
+    jpoint = PointJacobi(SECP256k1.curve, point[0], point[1], 1, N)
+    def timed(f):
+        t = time.perf_counter()
+        for k in ks:
+            f(k)
+        return (time.perf_counter() - t)/n*1e6
+    def double_and_add(k):
+        acc = None
+        for bit in bin(k)[2:]:
+            acc = _double(acc)
+            if bit == '1':
+                acc = _add_mixed(acc, point)
+        return _to_affine(acc)
+    results = [("ecdsa PointJacobi", timed(lambda k: (k*jpoint).to_affine())),
+               ("double-and-add", timed(double_and_add)),
+               ("GLV + wNAF", timed(lambda k: multiply(k, point))),
+               ("fixed-base k*G", timed(multiply_base))]
+    for name, us in results:
+        print("%-20s %8.1f us" % (name, us))
+
+
+if __name__ == '__main__':
+    import sys
+    test()
+    print("all tests passed")
+    if "bench" in sys.argv[1:]:
+        bench()
@@ -116,6 +116,9 @@ def get_mnemonic(interactive, semi):
       raise SystemExit
   else:
     m = get_input("Secret phrase:\n", interactive)
+  return normalize_mnemonic(m)
+
+def normalize_mnemonic(m):
   m = "".join([v.lower() for v in m if v.lower() in ABET])
   return " ".join(m.split())
 
@@ -123,7 +126,8 @@ def main_loop(args):
   args.interactive = args.interactive and not args.semi
   interactive = args.interactive
   mnemonic = get_mnemonic(interactive, args.semi)
-  key = key_from_mnemonic(mnemonic)
+  # every command derives from the same few nodes
+  key = DerivationTree(key_from_mnemonic(mnemonic))
 
   currency = get_currency("XST")
 
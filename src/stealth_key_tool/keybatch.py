@@ -0,0 +1,155 @@
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import csv
+import array
+
+from .bip32utils import BIP32Key, Base58, derive_children
+from .bip32utils.BIP32Key import CURVE_ORDER
+from .bip32utils import secp256k1
+from .bip32utils.ripemd160 import hash160_many
+from .stealth_key_tool import (PURPOSE, WIF_COMPRESSED, DependencyError,
+                               addresses_from_hash160s, get_path)
+
+
+# bytes per key in each column
+WIDTHS = { "secrets": 32, "chains": 32, "pubkeys": 33, "hash160s": 20 }
+
+class KeyBatch:
+  """
+  Derived keys stored column-wise: the child `indices` in an `array`
+  and the 32-byte `secrets` (private batches only), 32-byte `chains`,
+  33-byte compressed `pubkeys` and 20-byte `hash160s` of all keys
+  back to back in one `bytearray` each.
+
+  `secret(i)`, `chain_code(i)`, `public_key(i)` and `hash160(i)` are
+  zero-copy `memoryview`s of key `i`, and `as_numpy()` views a column
+  as an (n, width) array. Addresses, WIFs and CSV rows are encoded
+  straight from the columns; `key(i)` makes a `BIP32Key` only for the
+  keys that need one.
+  """
+  def __init__(self, parent):
+    self.parent = parent
+    self.private = not parent.public
+    self.indices = array.array("L")
+    self.secrets = bytearray()
+    self.chains = bytearray()
+    self.pubkeys = bytearray()
+    self.hash160s = bytearray()
+  @classmethod
+  def derive(cls, parent, indices):
+    """
+    Derives the non-hardened children of `parent` at `indices`. As
+    in BIP32, an index that gives an invalid key is skipped, so
+    `indices` of the batch may be shorter.
+    """
+    batch = cls(parent)
+    batch.extend(indices)
+    return batch
+  def extend(self, indices):
+    "Derives and appends the children of the parent at `indices`"
+    indices = list(indices)
+    secret = self.parent.secret
+    pubkeys = []
+    for i, child in zip(indices, derive_children(self.parent, indices)):
+      if child is None:
+        continue
+      tweak, chain, point = child
+      if self.private:
+        self.secrets += ((tweak + secret) % CURVE_ORDER).to_bytes(32, "big")
+      self.indices.append(i)
+      self.chains += chain
+      pubkeys.append(secp256k1.compress(point))
+    self.pubkeys += b"".join(pubkeys)
+    self.hash160s += b"".join(hash160_many(pubkeys))
+  def __len__(self):
+    return len(self.indices)
+  def _row(self, column, i):
+    width = WIDTHS[column]
+    if not -len(self) <= i < len(self):
+      raise IndexError("key index out of range")
+    i %= len(self)
+    return memoryview(getattr(self, column))[i * width:(i + 1) * width]
+  def secret(self, i):
+    if not self.private:
+      raise ValueError("batch of public keys has no secrets")
+    return self._row("secrets", i)
+  def chain_code(self, i):
+    return self._row("chains", i)
+  def public_key(self, i):
+    return self._row("pubkeys", i)
+  def hash160(self, i):
+    return self._row("hash160s", i)
+  def key(self, i):
+    "Makes a `BIP32Key` of key `i`"
+    if not self.private:
+      return self.parent.ChildKey(self.indices[i])
+    return BIP32Key(secret=bytes(self.secret(i)),
+                    chain=bytes(self.chain_code(i)),
+                    depth=self.parent.depth + 1, index=self.indices[i],
+                    fpr=self.parent, testnet=self.parent.testnet)
+  def as_numpy(self, column):
+    """
+    Returns a zero-copy (n, width) `numpy.uint8` view of `column`
+    ("secrets", "chains", "pubkeys" or "hash160s"). Needs NumPy.
+    """
+    try:
+      import numpy
+    except ImportError:
+      raise DependencyError("KeyBatch.as_numpy() requires numpy")
+    buf = getattr(self, column)
+    return numpy.frombuffer(buf, dtype=numpy.uint8).reshape(-1, WIDTHS[column])
+  def addresses(self, currency):
+    """
+    Yields the address of every key for `currency`. If it has a P2PKH
+    network byte (`addr_net_byte`), the addresses are encoded together
+    from the hash160 column, otherwise one at a time from `key(i)`.
+    """
+    if currency.addr_net_byte is not None:
+      for address in self.encode_addresses(currency)["p2pkh"]:
+        yield address
+    else:
+      for i in range(len(self)):
+        yield currency.get_address(self.key(i))
+  def encode_addresses(self, currency, formats=("p2pkh",)):
+    """
+    Returns a dict of the list of addresses in each of `formats`, as
+    `get_addresses()` does, encoded from the hash160 column
+    """
+    hash160s = [bytes(self.hash160(i)) for i in range(len(self))]
+    return addresses_from_hash160s(hash160s, currency, formats)
+  def wifs(self, currency):
+    "Yields the compressed WIF private key of every key for `currency`"
+    prefix = currency.wif_net_byte
+    payloads = [prefix + bytes(self.secret(i)) + WIF_COMPRESSED
+                for i in range(len(self))]
+    for wif in Base58.check_encode_many(payloads):
+      yield wif
+  def write_csv(self, f, currency, account=0, change=0, private=False):
+    """
+    Writes one CSV row per key to the file `f`: the derivation path
+    (taking the parent as `account`/`change` of `currency`), address,
+    public key in hex and, if `private`, the WIF private key.
+    """
+    writer = csv.writer(f)
+    header = ["path", "address", "public key"]
+    columns = [self.addresses(currency)]
+    if private:
+      header.append("wif")
+      columns.append(self.wifs(currency))
+    writer.writerow(header)
+    for i, values in enumerate(zip(*columns)):
+      path = get_path(PURPOSE, currency.coin, account, change, self.indices[i])
+      writer.writerow([path, values[0], self.public_key(i).hex()] +
+                      list(values[1:]))
@@ -1 +1,2 @@
-from .pbkdf2 import pbkdf2
+from .pbkdf2 import (pbkdf2, pbkdf2_many, set_backend, get_backend,
+                     available_backends, register_backend)
@@ -14,13 +14,51 @@
 # ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import hmac
 import hashlib
 import os
+import time
 import struct
+import multiprocessing
+import concurrent.futures
 
 
-def pbkdf2(digestmod, password: 'bytes', salt, count, dk_length) -> 'bytes':
+# PBKDF2 HMAC-SHA1 Test Vectors: http://tools.ietf.org/html/rfc6070
+# One of the test vectors has been removed because it takes
+# too long to calculate. This was a test vector of 2^24 iterations.
+# Since there is no difference between integers and long integers
+# in python3, this will work as well as the others.
+RFC6070_VECTORS = (
+    ((b"password", b"salt", 1, 20),
+        b"\x0c\x60\xc8\x0f\x96\x1f\x0e\x71\xf3\xa9\xb5\x24\xaf\x60\x12\x06"
+        b"\x2f\xe0\x37\xa6"),
+    ((b"password", b"salt", 2, 20),
+        b"\xea\x6c\x01\x4d\xc7\x2d\x6f\x8c\xcd\x1e\xd9\x2a\xce\x1d\x41\xf0"
+        b"\xd8\xde\x89\x57"),
+    ((b"password", b"salt", 4096, 20),
+        b"\x4b\x00\x79\x01\xb7\x65\x48\x9a\xbe\xad\x49\xd9\x26\xf7\x21\xd0"
+        b"\x65\xa4\x29\xc1"),
+    ((b"passwordPASSWORDpassword",
+      b"saltSALTsaltSALTsaltSALTsaltSALTsalt", 4096, 25),
+        b"\x3d\x2e\xec\x4f\xe4\x1c\x84\x9b\x80\xc8\xd8\x36\x62\xc0\xe4\x4a"
+        b"\x8b\x29\x1a\x96\x4c\xf2\xf0\x70\x38"),
+    ((b"pass\0word", b"sa\0lt", 4096, 16),
+        b"\x56\xfa\x6a\xa7\x55\x48\x09\x9d\xcc\x37\xd7\xf0\x34\x25\xe0\xc3"),
+)
+
+# BIP39 seed vector (HMAC-SHA512, 2048 rounds, 64 bytes):
+#   https://github.com/trezor/python-mnemonic/blob/master/vectors.json
+BIP39_VECTORS = (
+    ((b"abandon abandon abandon abandon abandon abandon"
+      b" abandon abandon abandon abandon abandon about",
+      b"mnemonicTREZOR", 2048, 64),
+        bytes.fromhex("c55257c360c07c72029aebc1b53c05ed0362ada38ead3e3e9efa3708e534"
+                      "95531f09a6987599d18264c1e1c92f2cf141630c7a3c4ab7c81b2f001698"
+                      "e7463b04")),
+)
+
+
+def pbkdf2(digestmod, password: 'bytes', salt, count, dk_length,
+           workers=None) -> 'bytes':
     '''
     PBKDF2, from PKCS #5 v2.0:
         http://tools.ietf.org/html/rfc2898
@@ -58,62 +96,328 @@ def pbkdf2(digestmod, password: 'bytes', salt, count, dk_length) -> 'bytes':
             it makes sense to use a larger digest hash function if your
             key size is large. 
 
+        workers
+            The number of processes used to compute the blocks of
+            the key concurrently (see pbkdf2_parallel()). If None,
+            the blocks are computed in parallel only when digestmod
+            is a hashlib constructor, processes are started by
+            forking, and the estimated time saved exceeds the cost
+            of the pool. If 1, the active backend always computes
+            the key serially.
+
+    The work is done by the active backend (see set_backend()).
+
+    '''
+    if workers is None:
+        workers = _auto_workers(digestmod, count, dk_length)
+    if workers > 1:
+        return pbkdf2_parallel(digestmod, password, salt, count, dk_length,
+                               workers)
+    return _backends[_active](digestmod, password, salt, count, dk_length)
+
+
+def _keyed_states(digestmod, key):
+    '''
+    Returns the (inner, outer) hash objects of HMAC after absorbing
+    the padded key, i.e. the midstates that hmac.new() would compute.
+    '''
+    inner, outer = digestmod(), digestmod()
+    block_size = inner.block_size
+    if len(key) > block_size:
+        key = digestmod(key).digest()
+    key = key.ljust(block_size, b'\0')
+    inner.update(bytes(b ^ 0x36 for b in key))
+    outer.update(bytes(b ^ 0x5c for b in key))
+    return inner, outer
+
+
+def _pbkdf2_block(inner, outer, salt, count, i):
+    '''
+    Computes block i of the derived key from the keyed HMAC midstates.
+    '''
+    from_bytes = int.from_bytes
+    icopy, ocopy = inner.copy, outer.copy
+    # in the first iteration, the hmac message is the salt
+    # concatinated with the block number in the form of \x00\x00\x00\x01
+    h = icopy()
+    h.update(salt + struct.pack(">i", i))
+    o = ocopy()
+    o.update(h.digest())
+    u = o.digest()
+    # the exclusive or of all digests is accumulated as one integer
+    r = from_bytes(u, 'big')
+    for _ in range(count - 1):
+        # in subsequent iterations, the hmac message is the previous
+        # hmac digest. Cloning the keyed states skips the key schedule.
+        h = icopy()
+        h.update(u)
+        o = ocopy()
+        o.update(h.digest())
+        u = o.digest()
+        r ^= from_bytes(u, 'big')
+    return r.to_bytes(len(u), 'big')
+
+
+def pbkdf2_pure(digestmod, password, salt, count, dk_length):
+    '''
+    Pure python PBKDF2, used when no faster backend verifies.
+    Arguments are the same as for pbkdf2().
+
+    HMAC is computed from inner and outer hash states that are keyed
+    once and copied for every round, which gives the same output as
+    calling hmac.new() each round at a fraction of the cost.
     '''
-    def pbkdf2_function(pw, salt, count, i):
-        # in the first iteration, the hmac message is the salt
-        # concatinated with the block number in the form of \x00\x00\x00\x01
-        r = u = hmac.new(pw, salt + struct.pack(">i", i), digestmod).digest()
-        for i in range(2, count + 1):
-            # in subsequent iterations, the hmac message is the
-            # previous hmac digest. The key is always the users password
-            # see the hmac specification for notes on padding and stretching
-            u = hmac.new(pw, u, digestmod).digest()
-            # this is the exclusive or of the two byte-strings
-            r = bytes(i ^ j for i, j in zip(r, u))
-        return r
-    dk, h_length = b'', digestmod().digest_size
+    inner, outer = _keyed_states(digestmod, password)
+    dk, h_length = b'', inner.digest_size
     # we generate as many blocks as are required to
     # concatinate to the desired key size:
     blocks = (dk_length // h_length) + (1 if dk_length % h_length else 0)
     for i in range(1, blocks + 1):
-        dk += pbkdf2_function(password, salt, count, i)
+        dk += _pbkdf2_block(inner, outer, salt, count, i)
     # The length of the key wil be dk_length to the nearest
     # hash block size, i.e. larger than or equal to it. We
     # slice it to the desired length befor returning it.
     return dk[:dk_length]
 
 
+def pbkdf2_hashlib(digestmod, password, salt, count, dk_length):
+    '''
+    PBKDF2 from hashlib.pbkdf2_hmac (OpenSSL), falling back to
+    pbkdf2_pure() for digests that hashlib does not know by name.
+    Arguments are the same as for pbkdf2().
+    '''
+    name = getattr(digestmod(), "name", None)
+    if name not in hashlib.algorithms_available:
+        return pbkdf2_pure(digestmod, password, salt, count, dk_length)
+    return hashlib.pbkdf2_hmac(name, password, salt, count, dk_length)
+
+
+def pbkdf2_many(digestmod, passwords, salts, count, dk_length):
+    '''
+    Batched pbkdf2() over many independent passwords, returning a
+    list with one derived key per password, in order.
+
+        passwords
+            An iterable of passwords (bytes)
+
+        salts
+            Either a single salt (bytes) shared by every password,
+            or an iterable of salts parallel to passwords.
+
+    The remaining arguments are the same as for pbkdf2(). Each key is
+    computed with the active backend; to use more than one core, see
+    seeds_from_mnemonics() in stealth_key_tool.
+    '''
+    passwords = list(passwords)
+    if isinstance(salts, (bytes, bytearray)):
+        salts = [salts] * len(passwords)
+    else:
+        salts = list(salts)
+        if len(salts) != len(passwords):
+            raise ValueError("got %d salts for %d passwords" %
+                             (len(salts), len(passwords)))
+    function = _backends[_active]
+    return [function(digestmod, pw, salt, count, dk_length)
+            for pw, salt in zip(passwords, salts)]
+
+
+# name -> function, in order of preference
+_backends = {}
+# name -> result of verify_backend(), filled in lazily
+_verified = {}
+_active = None
+
+
+def verify_backend(function):
+    '''
+    Returns True if function reproduces the RFC 6070 (HMAC-SHA1)
+    and BIP39 (HMAC-SHA512) test vectors.
+    '''
+    try:
+        for v, r in RFC6070_VECTORS:
+            if function(hashlib.sha1, *v) != r:
+                return False
+        for v, r in BIP39_VECTORS:
+            if function(hashlib.sha512, *v) != r:
+                return False
+    except Exception:
+        return False
+    return True
+
+
+def _is_verified(name):
+    if name not in _verified:
+        _verified[name] = verify_backend(_backends[name])
+    return _verified[name]
+
+
+def register_backend(name, function):
+    '''
+    Adds a backend with the same signature as pbkdf2() under name.
+    The backend is verified against the test vectors when selected.
+    '''
+    _backends[name] = function
+    _verified.pop(name, None)
+
+
+def set_backend(name):
+    '''
+    Selects the backend used by pbkdf2(). Raises ValueError if name
+    is unknown or the backend fails the test vectors.
+    '''
+    global _active
+    if name not in _backends:
+        raise ValueError("unknown pbkdf2 backend %r" % (name,))
+    if not _is_verified(name):
+        raise ValueError("pbkdf2 backend %r failed verification" % (name,))
+    _active = name
+
+
+def get_backend():
+    '''Returns the name of the backend used by pbkdf2().'''
+    return _active
+
+
+def available_backends():
+    '''Returns the names of all backends that pass verification.'''
+    return [name for name in _backends if _is_verified(name)]
+
+
+def _select_default():
+    # the pure backend is only verified if nothing faster is usable
+    for name in _backends:
+        if _is_verified(name):
+            set_backend(name)
+            return
+    raise RuntimeError("no pbkdf2 backend passes verification")
+
+
+if hasattr(hashlib, "pbkdf2_hmac"):
+    register_backend("hashlib", pbkdf2_hashlib)
+register_backend("pure", pbkdf2_pure)
+_select_default()
+
+
+# runs in the worker processes of pbkdf2_parallel()
+def _pbkdf2_block_job(digestmod, password, salt, count, i):
+    inner, outer = _keyed_states(digestmod, password)
+    return _pbkdf2_block(inner, outer, salt, count, i)
+
+
+def pbkdf2_parallel(digestmod, password, salt, count, dk_length,
+                    workers=None):
+    '''
+    PBKDF2 with the blocks of the derived key computed concurrently
+    in a pool of worker processes (default: one per CPU) by the pure
+    engine, then joined in order. Arguments are the same as for
+    pbkdf2(). This only pays off when dk_length spans several digests.
+    If the pool fails, e.g. because digestmod can't be pickled, the
+    blocks are computed serially instead.
+    '''
+    h_length = digestmod().digest_size
+    blocks = (dk_length // h_length) + (1 if dk_length % h_length else 0)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, blocks)
+    if workers < 2:
+        return pbkdf2_pure(digestmod, password, salt, count, dk_length)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_pbkdf2_block_job, digestmod, password,
+                                   salt, count, i)
+                       for i in range(1, blocks + 1)]
+            dk = b''.join(f.result() for f in futures)
+    except Exception:
+        # any error of the digest itself is raised again here
+        return pbkdf2_pure(digestmod, password, salt, count, dk_length)
+    return dk[:dk_length]
+
+
+# Estimated seconds to start a process pool, a conservative
+# figure for spawning interpreters that import this package.
+POOL_STARTUP = 0.25
+
+# (backend name, digest name) -> seconds per round of one block
+_round_costs = {}
+
+# digest constructors that are known to pickle, so they can be sent
+# to the worker processes
+_HASHLIB_CONSTRUCTORS = set(getattr(hashlib, name)
+                            for name in hashlib.algorithms_guaranteed
+                            if hasattr(hashlib, name))
+
+
+def _forks():
+    "Returns True if new processes are started by forking this one"
+    method = multiprocessing.get_start_method(allow_none=True)
+    if method is None:
+        # the default, without fixing it
+        method = multiprocessing.get_all_start_methods()[0]
+    return method == "fork"
+
+
+def _round_cost(name, digestmod):
+    key = (name, digestmod().name)
+    if key not in _round_costs:
+        rounds = 1024
+        function = _backends[name]
+        t = time.perf_counter()
+        function(digestmod, b"password", b"salt", rounds, 1)
+        _round_costs[key] = (time.perf_counter() - t) / rounds
+    return _round_costs[key]
+
+
+def _auto_workers(digestmod, count, dk_length):
+    '''
+    Returns the number of processes pbkdf2() should use: more than 1
+    only if the active backend is one of the built-in ones, digestmod
+    is a hashlib constructor, the pool would be forked (spawned workers
+    re-import the caller's main module), and the parallel pure engine
+    is estimated to beat the active backend, pool included.
+    '''
+    if (digestmod not in _HASHLIB_CONSTRUCTORS) or not _forks():
+        return 1
+    h_length = digestmod().digest_size
+    blocks = (dk_length // h_length) + (1 if dk_length % h_length else 0)
+    cpus = os.cpu_count() or 1
+    if (blocks < 2) or (cpus < 2) or (_active not in ("hashlib", "pure")):
+        return 1
+    workers = min(cpus, blocks)
+    # cheap upper bound first, so short keys are never timed
+    serial = _round_cost(_active, digestmod) * count * blocks
+    if serial <= POOL_STARTUP:
+        return 1
+    rounds = -(-blocks // workers)
+    parallel = _round_cost("pure", digestmod) * count * rounds + POOL_STARTUP
+    return workers if parallel < serial else 1
+
+
 def test():
     '''
     PBKDF2 HMAC-SHA1 Test Vectors:
         http://tools.ietf.org/html/rfc6070
 
+    BIP39 HMAC-SHA512 Test Vectors:
+        https://github.com/bitcoin/bips/blob/master/bip-0039.mediawiki
+
+    Every registered backend is checked, as well as pbkdf2() itself.
     '''
-    # One of the test vectors has been removed because it takes
-    # too long to calculate. This was a test vector of 2^24 iterations.
-    # Since there is no difference between integers and long integers
-    # in python3, this will work as well as the others.
-    rfc6070_test_vectors = (
-        (b"password", b"salt", 1, 20),
-        (b"password", b"salt", 2, 20),
-        (b"password", b"salt", 4096, 20),
-        (b"passwordPASSWORDpassword",
-            b"saltSALTsaltSALTsaltSALTsaltSALTsalt", 4096, 25),
-        (b"pass\0word", b"sa\0lt", 4096, 16),
-    )
-    rfc6070_results = (
-        b"\x0c\x60\xc8\x0f\x96\x1f\x0e\x71\xf3\xa9\xb5\x24\xaf\x60\x12\x06"
-            b"\x2f\xe0\x37\xa6",
-        b"\xea\x6c\x01\x4d\xc7\x2d\x6f\x8c\xcd\x1e\xd9\x2a\xce\x1d\x41\xf0"
-            b"\xd8\xde\x89\x57",
-        b"\x4b\x00\x79\x01\xb7\x65\x48\x9a\xbe\xad\x49\xd9\x26\xf7\x21\xd0"
-            b"\x65\xa4\x29\xc1",
-        b"\x3d\x2e\xec\x4f\xe4\x1c\x84\x9b\x80\xc8\xd8\x36\x62\xc0\xe4\x4a"
-            b"\x8b\x29\x1a\x96\x4c\xf2\xf0\x70\x38",
-        b"\x56\xfa\x6a\xa7\x55\x48\x09\x9d\xcc\x37\xd7\xf0\x34\x25\xe0\xc3",
-    )
-    for v, r in zip(rfc6070_test_vectors, rfc6070_results):
+    for name, function in _backends.items():
+        assert verify_backend(function), name
+    for v, r in RFC6070_VECTORS:
         assert pbkdf2(hashlib.sha1, *v) == r, v
+    for v, r in BIP39_VECTORS:
+        assert pbkdf2(hashlib.sha512, *v) == r, v
+    (pw, salt, count, dk_length), r = BIP39_VECTORS[0]
+    assert pbkdf2_many(hashlib.sha512, [pw, b"", pw],
+                       [salt, salt, salt], count, dk_length) == \
+        [r, pbkdf2(hashlib.sha512, b"", salt, count, dk_length), r]
+    assert pbkdf2_many(hashlib.sha512, [pw], salt, count, dk_length) == [r]
+    # a key of 5 digests, computed in parallel
+    v = (b"password", b"salt", 64, 90)
+    r = pbkdf2(hashlib.sha1, *v, workers=1)
+    assert pbkdf2_parallel(hashlib.sha1, *v, workers=2) == r
+    assert pbkdf2(hashlib.sha1, *v, workers=3) == r
 
 
 if __name__ == '__main__':
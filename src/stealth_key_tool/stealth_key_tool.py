@@ -12,14 +12,23 @@
 # ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import os
+import copy
+import hmac
+import time
 import string
 import base64
 import hashlib
+import itertools
+import threading
+import collections
+import concurrent.futures
 
 from Crypto.Hash import keccak
 
-from .pbkdf2 import pbkdf2
-from .bip32utils import BIP32Key, BIP32_HARDEN, Base58
+from .pbkdf2 import pbkdf2, get_backend, set_backend
+from .bip32utils import BIP32Key, BIP32_HARDEN, BIP32Path, Base58, Bech32
+from .bip32utils.ripemd160 import hash160_many
 
 
 TEST = False
@@ -58,6 +67,20 @@ WIF_NET_FTC = bytes([0x8e])   # 142
 WIF_NET_VTC = bytes([0x80])   # 128
 WIF_COMPRESSED = bytes([0x01])  # 1 -> is compressed
 
+# p2sh net byte values
+P2SH_NET_BTC = 5
+P2SH_NET_LTC = 50
+P2SH_NET_DOGE = 22
+P2SH_NET_VTC = 5
+
+# bech32 human readable parts
+HRP_BTC = "bc"
+HRP_LTC = "ltc"
+HRP_VTC = "vtc"
+
+# formats of get_addresses()
+ADDRESS_FORMATS = ("p2pkh", "p2sh-p2wpkh", "p2wpkh")
+
 
 class KeyToolError(Exception):
   pass
@@ -86,6 +109,11 @@ def get_p2pkh_address(key, netbyte):
   vh160 = netbyte.to_bytes(1, "big") + key.Identifier()
   return Base58.check_encode(vh160)
 
+# bulk version of get_p2pkh_address(), encoding the whole batch at once
+def get_p2pkh_addresses(keys, netbyte):
+  prefix = netbyte.to_bytes(1, "big")
+  return Base58.check_encode_many([prefix + k.Identifier() for k in keys])
+
 # network byte is ignored
 def get_eth_address(key, netbyte=None):
   x = keccak_256(key.PublicKey(compressed=False)).hexdigest()[-40:]
@@ -105,24 +133,69 @@ def get_eth_address(key, netbyte=None):
 def get_wif(key, net_byte):
   if isinstance(net_byte, int):
     net_byte = net_byte.to_bytes(1, "big")
-  raw = net_byte + key.k.to_string() + WIF_COMPRESSED
+  raw = net_byte + key.PrivateKey() + WIF_COMPRESSED
   return Base58.check_encode(raw)
 
+def addresses_from_hash160s(hash160s, currency, formats=("p2pkh",)):
+  """
+  Returns a dict of the list of addresses of `currency` in each of
+  `formats` (see `ADDRESS_FORMATS`) for the 20-byte public key hashes
+  `hash160s`. Base58 addresses are encoded a whole list at a time.
+  """
+  result = {}
+  for fmt in formats:
+    if fmt == "p2pkh":
+      if currency.addr_net_byte is None:
+        raise CoinError("%s has no p2pkh addresses" % currency.ticker)
+      prefix = currency.addr_net_byte.to_bytes(1, "big")
+      payloads = [prefix + h for h in hash160s]
+    elif fmt == "p2sh-p2wpkh":
+      if currency.p2sh_net_byte is None:
+        raise CoinError("%s has no p2sh-p2wpkh addresses" % currency.ticker)
+      prefix = currency.p2sh_net_byte.to_bytes(1, "big")
+      scripts = [b"\x00\x14" + h for h in hash160s]
+      payloads = [prefix + h for h in hash160_many(scripts)]
+    elif fmt == "p2wpkh":
+      if currency.hrp is None:
+        raise CoinError("%s has no p2wpkh addresses" % currency.ticker)
+      result[fmt] = [Bech32.encode(currency.hrp, 0, h) for h in hash160s]
+      continue
+    else:
+      raise ValueError("Address format \"%s\" not valid" % fmt)
+    result[fmt] = Base58.check_encode_many(payloads)
+  return result
+
+def get_addresses(keys, currency, formats=("p2pkh",)):
+  """
+  Returns the addresses of `currency` in each of `formats` (see
+  `ADDRESS_FORMATS`) as a dict, computing the public key and its hash
+  once per key. For a single `BIP32Key` the dict values are addresses,
+  for a sequence of keys they are lists of addresses in key order.
+  """
+  if isinstance(keys, BIP32Key):
+    result = addresses_from_hash160s([keys.Identifier()], currency, formats)
+    return dict((fmt, addresses[0]) for (fmt, addresses) in result.items())
+  return addresses_from_hash160s([k.Identifier() for k in keys],
+                                 currency, formats)
+
 class Currency:
    def __init__(self, name, ticker,
                       coin, addr_net_byte, wif_net_byte,
-                      get_addr):
+                      get_addr, p2sh_net_byte=None, hrp=None):
      self.name = name
      self.ticker = ticker
      self.coin = coin 
      self.addr_net_byte = addr_net_byte
      self.wif_net_byte = wif_net_byte
      self._get_address_inner = get_addr
+     self.p2sh_net_byte = p2sh_net_byte
+     self.hrp = hrp
    def get_copy(self):
      return self.__class__(self.name, self.ticker,
                            self.coin,
                            self.addr_net_byte, self.wif_net_byte,
-                           self._get_address_inner)
+                           self._get_address_inner,
+                           self.p2sh_net_byte, self.hrp)
    def get_address(self, child):
      return self._get_address_inner(child, self.addr_net_byte)
 
@@ -131,22 +204,22 @@ XST = Currency("Stealth", "XST",
                get_p2pkh_address)
 BTC = Currency("Bitcoin", "BTC",
                COIN_BTC, ADDR_NET_BTC, WIF_NET_BTC,
-               get_p2pkh_address)
+               get_p2pkh_address, P2SH_NET_BTC, HRP_BTC)
 ETH = Currency("Ethereum", "ETH",
                COIN_ETH, None, WIF_NET_BTC,
                get_eth_address)
 LTC = Currency("Litecoin", "LTC",
                COIN_LTC, ADDR_NET_LTC, WIF_NET_LTC,
-               get_p2pkh_address)
+               get_p2pkh_address, P2SH_NET_LTC, HRP_LTC)
 DOGE = Currency("Dogecoin", "DOGE",
                 COIN_DOGE, ADDR_NET_DOGE, WIF_NET_DOGE,
-                get_p2pkh_address)
+                get_p2pkh_address, P2SH_NET_DOGE)
 FTC = Currency("Feathercoin", "FTC",
                 COIN_FTC, ADDR_NET_FTC, WIF_NET_FTC,
                 get_p2pkh_address)
 VTC = Currency("Vertcoin", "VTC",
                 COIN_VTC, ADDR_NET_VTC, WIF_NET_VTC,
-                get_p2pkh_address)
+                get_p2pkh_address, P2SH_NET_VTC, HRP_VTC)
 
 
 CURRENCIES = { "XST":XST, "BTC":BTC, "ETH":ETH, "LTC":LTC,
@@ -163,30 +236,235 @@ def seed_from_mnemonic(mnemonic, salt=""):
   s = b"mnemonic" + salt.encode("utf-8")
   return  pbkdf2(hashlib.sha512, m, s, ROUNDS, NBYTES)
 
-def key_from_mnemonic(mnemonic, salt=""):
+def key_from_mnemonic(mnemonic, salt="", cache=None):
+  if cache is not None:
+    return cache.get_key(mnemonic, salt)
   seed = seed_from_mnemonic(mnemonic, salt)
   return BIP32Key.fromEntropy(seed)
 
+class KeyCache:
+  """
+  Bounded, opt-in cache of master keys for `key_from_mnemonic()`.
+
+  Entries are found by an HMAC-SHA256 of the mnemonic and salt under a
+  random key that never leaves the process, so neither is stored.
+  Each entry holds the master secret and chain code in a `bytearray`
+  that is zeroed when the entry is evicted (least recently used once
+  there are more than `maxsize` entries), when the cache is cleared, or
+  once it is older than `ttl` seconds, at the next call of `get_key()`,
+  `stats()` or `len()`. Every lookup returns a new `BIP32Key`, so
+  callers can't modify the cached material.
+  """
+  def __init__(self, maxsize=16, ttl=None):
+    if maxsize < 1:
+      raise ValueError("Cache size %s is not valid" % (maxsize,))
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+    self._hmac_key = os.urandom(32)
+    # digest -> (expiry time or None, secret + chain code)
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+  def __len__(self):
+    with self._lock:
+      self._expire()
+      return len(self._entries)
+  def _digest(self, mnemonic, salt):
+    m = mnemonic.encode("utf-8")
+    data = len(m).to_bytes(4, "big") + m + salt.encode("utf-8")
+    return hmac.new(self._hmac_key, data, hashlib.sha256).digest()
+  def _discard(self, digest):
+    material = self._entries.pop(digest)[1]
+    material[:] = bytes(len(material))
+  def _expire(self):
+    "Discards all expired entries, the lock must be held"
+    if self.ttl is None:
+      return
+    now = time.monotonic()
+    expired = [digest for (digest, (expiry, material)) in self._entries.items()
+               if expiry <= now]
+    for digest in expired:
+      self._discard(digest)
+    self.expirations += len(expired)
+  def get_key(self, mnemonic, salt=""):
+    digest = self._digest(mnemonic, salt)
+    with self._lock:
+      self._expire()
+      entry = self._entries.get(digest)
+      if entry is not None:
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        material = bytes(entry[1])
+      else:
+        self.misses += 1
+        material = None
+    if material is not None:
+      return BIP32Key(secret=material[:32], chain=material[32:],
+                      depth=0, index=0, fpr=b'\0\0\0\0')
+    key = BIP32Key.fromEntropy(seed_from_mnemonic(mnemonic, salt))
+    expiry = None if self.ttl is None else time.monotonic() + self.ttl
+    with self._lock:
+      self._expire()
+      if digest in self._entries:
+        self._discard(digest)
+      self._entries[digest] = (expiry,
+                               bytearray(key.PrivateKey() + key.ChainCode()))
+      while len(self._entries) > self.maxsize:
+        self._discard(next(iter(self._entries)))
+        self.evictions += 1
+    return key
+  def clear(self):
+    with self._lock:
+      while self._entries:
+        self._discard(next(iter(self._entries)))
+  def stats(self):
+    with self._lock:
+      self._expire()
+      lookups = self.hits + self.misses
+      return { "size": len(self._entries),
+               "maxsize": self.maxsize,
+               "hits": self.hits,
+               "misses": self.misses,
+               "evictions": self.evictions,
+               "expirations": self.expirations,
+               "hit ratio": (self.hits / lookups) if lookups else 0.0 }
+
+# runs in the worker processes of seeds_from_mnemonics()
+def _seeds_chunk(mnemonics, salt, backend):
+  if get_backend() != backend:
+    set_backend(backend)
+  return [seed_from_mnemonic(m, salt) for m in mnemonics]
+
+def seeds_from_mnemonics(mnemonics, salt="", workers=None, chunksize=16):
+  """
+  Yields the seed of every mnemonic in the iterable `mnemonics`, in
+  input order, computing them in a pool of `workers` processes
+  (default: one per CPU). At most 2 * `workers` chunks of `chunksize`
+  mnemonics are in flight at any time, so `mnemonics` may be a
+  long or unbounded stream. With `workers` < 2 no pool is used.
+  The workers use the same PBKDF2 backend as the caller.
+  """
+  if workers is None:
+    workers = os.cpu_count() or 1
+  if workers < 2:
+    for m in mnemonics:
+      yield seed_from_mnemonic(m, salt)
+    return
+  backend = get_backend()
+  it = iter(mnemonics)
+  pending = collections.deque()
+  with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+    try:
+      while True:
+        while len(pending) < 2 * workers:
+          chunk = list(itertools.islice(it, chunksize))
+          if not chunk:
+            break
+          pending.append(pool.submit(_seeds_chunk, chunk, salt, backend))
+        if not pending:
+          break
+        for seed in pending.popleft().result():
+          yield seed
+    finally:
+      for f in pending:
+        f.cancel()
+
+def keys_from_mnemonics(mnemonics, salt="", workers=None, chunksize=16):
+  """
+  Like seeds_from_mnemonics() but yields the master `BIP32Key`
+  of every mnemonic.
+  """
+  for seed in seeds_from_mnemonics(mnemonics, salt, workers, chunksize):
+    yield BIP32Key.fromEntropy(seed)
+
+class DerivationTree:
+  """
+  Memoizes the keys derived from the `root` key, by path. A path is a
+  sequence of child indices (hardened ones including `BIP32_HARDEN`)
+  or a `BIP32Path` without ranges, and a key is derived from its
+  longest memoized prefix, so walking the address indices under one
+  change node costs one child derivation per address. Once more than
+  `maxsize` nodes are held, the least recently used is evicted. Every
+  lookup returns a new copy of the node, so callers can't modify the
+  memoized keys.
+  """
+  def __init__(self, root, maxsize=1024):
+    if maxsize < 1:
+      raise ValueError("Tree size %s is not valid" % (maxsize,))
+    self.root = root
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    # path tuple -> BIP32Key
+    self._nodes = collections.OrderedDict()
+    self._lock = threading.Lock()
+  def __len__(self):
+    return len(self._nodes)
+  def get_key(self, path):
+    if isinstance(path, BIP32Path):
+      path = path.Indices()
+    path = tuple(path)
+    with self._lock:
+      depth = len(path)
+      key = self.root
+      while depth:
+        node = self._nodes.get(path[:depth])
+        if node is not None:
+          self._nodes.move_to_end(path[:depth])
+          key = node
+          break
+        depth -= 1
+      if depth == len(path):
+        self.hits += 1
+      else:
+        self.misses += 1
+    for depth in range(depth, len(path)):
+      key = key.ChildKey(path[depth])
+      with self._lock:
+        self._nodes[path[:depth + 1]] = key
+        self._nodes.move_to_end(path[:depth + 1])
+        while len(self._nodes) > self.maxsize:
+          self._nodes.popitem(last=False)
+          self.evictions += 1
+    return copy.copy(key)
+  def clear(self):
+    with self._lock:
+      self._nodes.clear()
+  def stats(self):
+    with self._lock:
+      lookups = self.hits + self.misses
+      return { "size": len(self._nodes),
+               "maxsize": self.maxsize,
+               "hits": self.hits,
+               "misses": self.misses,
+               "evictions": self.evictions,
+               "hit ratio": (self.hits / lookups) if lookups else 0.0 }
+
 # all practical implementations harden the purpose, coin type, and account
 def get_child_key(key, purpose=PURPOSE,
                        coin_type=None,
                        account=None,
                        change=None,
                        address_index=None):
-  child1 = key.ChildKey(purpose + BIP32_HARDEN);
-  if coin_type is None:
-    return child1
-  child2 = child1.ChildKey(coin_type + BIP32_HARDEN)
-  if coin_type is None:
-    return child2
-  child3 = child2.ChildKey(account + BIP32_HARDEN)
-  if change is None:
-    return child3
-  child4 = child3.ChildKey(change)
-  if address_index is None:
-    return child4
-  child5 = child4.ChildKey(address_index)
-  return child5
+  """
+  Derives the child of `key` (a `BIP32Key` or a `DerivationTree`) at
+  the path given by the arguments, stopping at the first one that is
+  None.
+  """
+  path = [purpose + BIP32_HARDEN]
+  for i, v in enumerate((coin_type, account, change, address_index)):
+    if v is None:
+      break
+    path.append(v + BIP32_HARDEN if i < 2 else v)
+  if isinstance(key, DerivationTree):
+    return key.get_key(path)
+  for i in path:
+    key = key.ChildKey(i)
+  return key
 
 def get_path(purpose, coin, account, change, index):
   params = (purpose, coin, account, change, index)
@@ -223,7 +501,7 @@ def parse_path(pth):
   p = [v.strip() for v in p]
   try:
     if (p[0][-1] == "'"):
-      p = p[:-1]
+      p[0] = p[0][:-1]
     acc = int(p[0])
     assert (acc >= 0)
   except:
@@ -0,0 +1,196 @@
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import getpass
+import argparse
+import itertools
+import collections
+import concurrent.futures
+
+from .pbkdf2 import get_backend, set_backend
+from .bip32utils import ripemd160
+from .stealth_key_tool import (PURPOSE, key_from_mnemonic, get_child_key,
+                               get_currency, parse_path)
+
+
+def read_candidates(fname):
+  "Yields candidate passphrases, one per line, from a file or '-' for stdin"
+  f = sys.stdin if fname == "-" else open(fname, encoding="utf-8")
+  with f:
+    for line in f:
+      yield line.rstrip("\r\n")
+
+def read_checkpoint(fname, address, path):
+  """
+  Returns the number of candidates already swept according to the
+  checkpoint file, or 0 if there is none or it is for another search.
+  """
+  try:
+    with open(fname) as f:
+      state = json.load(f)
+  except FileNotFoundError:
+    return 0
+  if (state.get("address") != address) or (state.get("path") != list(path)):
+    return 0
+  return state["done"]
+
+def write_checkpoint(fname, address, path, done):
+  "Atomically records that the first `done` candidates were swept"
+  tmp = fname + ".tmp"
+  with open(tmp, "w") as f:
+    json.dump({"address": address, "path": list(path), "done": done}, f)
+  os.replace(tmp, fname)
+
+# runs in the worker processes of sweep_passphrases()
+def _sweep_chunk(mnemonic, candidates, address, currency, path, backend,
+                 provider):
+  if get_backend() != backend:
+    set_backend(backend)
+  if ripemd160.get_provider() != provider:
+    ripemd160.set_provider(provider)
+  account, change, index = path
+  for i, salt in enumerate(candidates):
+    key = key_from_mnemonic(mnemonic, salt)
+    child = get_child_key(key, PURPOSE, currency.coin, account, change, index)
+    if currency.get_address(child) == address:
+      return i
+  return None
+
+def sweep_passphrases(mnemonic, candidates, address, currency,
+                      path=(0, 0, 0), workers=None, chunksize=64,
+                      checkpoint=None, progress=None):
+  """
+  Searches the iterable `candidates` for the BIP39 passphrase (the salt
+  of `key_from_mnemonic()`) that gives `address` for `currency` at
+  `path` (account, change, index). Returns the passphrase, or None if
+  no candidate matches.
+
+  Candidates are swept `chunksize` at a time in a pool of `workers`
+  processes (default: one per CPU; no pool if < 2), which use the same
+  PBKDF2 backend and RIPEMD-160 provider as the caller. If `checkpoint` is
+  a file name, the number of candidates swept so far is saved there
+  after every chunk, and a later call with the same address and path
+  resumes after them. If given, `progress` is called after every chunk
+  with the number of candidates swept and the rate (candidates per
+  second) of this call.
+  """
+  if workers is None:
+    workers = os.cpu_count() or 1
+  path = tuple(path)
+  done = 0
+  if checkpoint is not None:
+    done = read_checkpoint(checkpoint, address, path)
+  it = itertools.islice(iter(candidates), done, None)
+  backend = get_backend()
+  provider = ripemd160.get_provider()
+  start, start_done = time.monotonic(), done
+
+  def finished(chunk):
+    nonlocal done
+    done += len(chunk)
+    if checkpoint is not None:
+      write_checkpoint(checkpoint, address, path, done)
+    if progress is not None:
+      elapsed = time.monotonic() - start
+      progress(done, (done - start_done) / elapsed if elapsed else 0.0)
+
+  if workers < 2:
+    while True:
+      chunk = list(itertools.islice(it, chunksize))
+      if not chunk:
+        return None
+      i = _sweep_chunk(mnemonic, chunk, address, currency, path, backend,
+                       provider)
+      if i is not None:
+        return chunk[i]
+      finished(chunk)
+
+  pending = collections.deque()
+  with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+    try:
+      while True:
+        while len(pending) < 2 * workers:
+          chunk = list(itertools.islice(it, chunksize))
+          if not chunk:
+            break
+          pending.append((chunk, pool.submit(_sweep_chunk, mnemonic, chunk,
+                                             address, currency, path,
+                                             backend, provider)))
+        if not pending:
+          return None
+        chunk, future = pending.popleft()
+        i = future.result()
+        if i is not None:
+          return chunk[i]
+        finished(chunk)
+    finally:
+      for chunk, future in pending:
+        future.cancel()
+
+
+def setup_args():
+  parser = argparse.ArgumentParser(
+             description="Find a forgotten BIP39 passphrase from a known address")
+  parser.add_argument("address",
+                      help="an address derived with the passphrase")
+  parser.add_argument("-c", "--currency", default="XST",
+                      help="currency ticker (default: XST)")
+  parser.add_argument("-p", "--path", default="0/0/0",
+                      help="account/change/index of the address (default: 0/0/0)")
+  parser.add_argument("-f", "--from-file", default="-",
+                      help="file of candidate passphrases, one per line, '-' for stdin")
+  parser.add_argument("-j", "--workers", type=int, default=None,
+                      help="number of worker processes (default: one per CPU)")
+  parser.add_argument("-k", "--checkpoint", default=None,
+                      help="file to save progress to and resume from")
+  return parser.parse_args()
+
+def main():
+  from .key_tool_cli import normalize_mnemonic, pstderr
+  args = setup_args()
+  try:
+    currency = get_currency(args.currency.upper())
+    path = parse_path(args.path)
+  except Exception as e:
+    pstderr("ERROR: %s" % (e,))
+    raise SystemExit(1)
+  # read from the terminal, stdin may hold the candidates
+  mnemonic = normalize_mnemonic(getpass.getpass("Secret phrase: "))
+  last = [0.0]
+  def progress(done, rate):
+    now = time.monotonic()
+    if now - last[0] >= 5:
+      last[0] = now
+      pstderr("%d candidates swept, %.1f/s" % (done, rate))
+  try:
+    found = sweep_passphrases(mnemonic, read_candidates(args.from_file),
+                              args.address, currency, path,
+                              workers=args.workers,
+                              checkpoint=args.checkpoint,
+                              progress=progress)
+  except KeyboardInterrupt:
+    pstderr()
+    raise SystemExit(1)
+  if found is None:
+    pstderr("No candidate matches")
+    raise SystemExit(1)
+  print(found)
+
+
+if __name__ == "__main__":
+  main()
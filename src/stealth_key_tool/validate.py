@@ -0,0 +1,102 @@
+# Copyright (c) 2022, James Stroud
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import os
+import sys
+import itertools
+import collections
+import concurrent.futures
+
+from .bip32utils import Base58
+from .bip32utils.Base58 import (VALID, BAD_CHARACTER, BAD_LENGTH,
+                                BAD_CHECKSUM, BAD_VERSION)
+
+
+# payload widths of p2pkh addresses (network byte + hash160) and of
+# extended keys
+ADDRESS_WIDTH = 21
+EXTENDED_KEY_WIDTH = 78
+
+STATUS_NAMES = { VALID: "valid",
+                 BAD_CHARACTER: "bad character",
+                 BAD_LENGTH: "bad length",
+                 BAD_CHECKSUM: "bad checksum",
+                 BAD_VERSION: "wrong version" }
+
+# The payload of record i is payloads[i*width:(i+1)*width], zeros
+# unless status[i] is VALID
+ValidatedChunk = collections.namedtuple("ValidatedChunk",
+                                        ["records", "payloads", "status"])
+
+def read_records(fname):
+  "Yields the records, one per non-blank line, of a file or '-' for stdin"
+  f = sys.stdin if fname == "-" else open(fname, encoding="utf-8")
+  with f:
+    for line in f:
+      line = line.strip()
+      if line:
+        yield line
+
+# runs in the worker processes of validate_records()
+def validate_chunk(records, width, versions=None):
+  """
+  Decodes the Base58Check strings `records` into one preallocated buffer
+  of `width` bytes per record, returning a `ValidatedChunk`.
+  """
+  payloads = bytearray(len(records) * width)
+  status = bytearray(len(records))
+  for i, record in enumerate(records):
+    status[i] = Base58.check_decode_into(record, payloads, i * width,
+                                         width, versions)
+  return ValidatedChunk(records, payloads, status)
+
+def validate_records(records, width, versions=None, workers=None,
+                     chunksize=4096):
+  """
+  Yields a `ValidatedChunk` for every `chunksize` Base58Check strings of
+  the iterable `records` (see `read_records()`), in input order. A record
+  is valid if its payload is `width` bytes with a good checksum and, if
+  `versions` is given, starts with one of the `bytes` in `versions`.
+  Failures are reported in the status codes, never raised.
+
+  Chunks are validated in a pool of `workers` processes (default: one
+  per CPU; no pool if < 2). At most 2 * `workers` chunks are in flight
+  at any time, so `records` may be a long or unbounded stream.
+  """
+  if workers is None:
+    workers = os.cpu_count() or 1
+  if versions is not None:
+    versions = [bytes(v) for v in versions]
+  it = iter(records)
+  if workers < 2:
+    while True:
+      chunk = list(itertools.islice(it, chunksize))
+      if not chunk:
+        return
+      yield validate_chunk(chunk, width, versions)
+  pending = collections.deque()
+  with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+    try:
+      while True:
+        while len(pending) < 2 * workers:
+          chunk = list(itertools.islice(it, chunksize))
+          if not chunk:
+            break
+          pending.append(pool.submit(validate_chunk, chunk, width, versions))
+        if not pending:
+          break
+        yield pending.popleft().result()
+    finally:
+      for f in pending:
+        f.cancel()
@@ -1 +1 @@
-VERSION="0.4.4"
+VERSION="0.5.0"
@@ -1,8 +1,12 @@
 #! /usr/bin/env python
 
 import os
+import time
+import hashlib
+import pickle
 import string
 import getpass
+import tempfile
 
 import stealth_key_tool as skt
 
@@ -34,6 +38,207 @@ def test():
   assert (address_eth  == "0xC5e19e780D06cBE23d4D972806bc5D30C9f3EFA3")
   print("ETH address is:       %s" % address_eth)
 
+  # bulk derivation matches the serial API, in input order
+  mnemonics = [mnemonic, "some random words", mnemonic]
+  seeds = list(skt.seeds_from_mnemonics(mnemonics, workers=2, chunksize=1))
+  assert seeds == [skt.seed_from_mnemonic(m) for m in mnemonics]
+  keys = list(skt.keys_from_mnemonics(mnemonics, workers=1))
+  assert [k.ExtendedKey() for k in keys] == [
+            skt.key_from_mnemonic(m).ExtendedKey() for m in mnemonics]
+  print("Bulk seeds and keys match")
+
+  # digests that can't be sent to worker processes are computed serially,
+  # whether the pool is chosen automatically or asked for
+  digest = lambda *args: hashlib.sha512(*args)
+  expected = hashlib.pbkdf2_hmac("sha512", b"pw", b"salt", 20000, 640)
+  cpu_count = os.cpu_count
+  os.cpu_count = lambda: 4
+  try:
+    assert skt.pbkdf2(digest, b"pw", b"salt", 20000, 640) == expected
+    assert skt.pbkdf2(digest, b"pw", b"salt", 20000, 640, workers=2) == expected
+  finally:
+    os.cpu_count = cpu_count
+  print("PBKDF2 worker selection works")
+
+  # cached master keys are new objects equal to uncached ones
+  cache = skt.KeyCache(maxsize=1)
+  k1 = skt.key_from_mnemonic(mnemonic, cache=cache)
+  k2 = skt.key_from_mnemonic(mnemonic, cache=cache)
+  assert k1 is not k2
+  assert k2.ExtendedKey() == key.ExtendedKey()
+  skt.key_from_mnemonic("some random words", cache=cache)
+  stats = cache.stats()
+  assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 2, 1)
+  # expired entries are zeroed and dropped without being looked up again
+  cache = skt.KeyCache(ttl=0.1)
+  skt.key_from_mnemonic(mnemonic, cache=cache)
+  (expiry, material), = cache._entries.values()
+  time.sleep(0.15)
+  skt.key_from_mnemonic("some random words", cache=cache)
+  stats = cache.stats()
+  assert (stats["size"], stats["expirations"]) == (1, 1)
+  assert not any(material)
+  time.sleep(0.15)
+  assert len(cache) == 0 and cache.stats()["expirations"] == 2
+  print("Key cache works")
+
+  # the passphrase is found serially and in a pool, resuming from a
+  # checkpoint, and the sweep gives None once every candidate fails
+  found = skt.get_child_key(skt.key_from_mnemonic(mnemonic, "salt2"),
+                            skt.PURPOSE, skt.XST.coin, 0, 0, 0)
+  address = skt.XST.get_address(found)
+  candidates = ["salt0", "salt1", "salt2", "salt3"]
+  for workers in (1, 2):
+    assert skt.sweep_passphrases(mnemonic, candidates, address, skt.XST,
+                                 workers=workers, chunksize=1) == "salt2"
+  checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint")
+  try:
+    skt.sweep.write_checkpoint(checkpoint, address, (0, 0, 0), 3)
+    assert skt.sweep_passphrases(mnemonic, candidates, address, skt.XST,
+                                 workers=1, checkpoint=checkpoint) is None
+    assert skt.sweep.read_checkpoint(checkpoint, address, (0, 0, 0)) == 4
+    skt.sweep.write_checkpoint(checkpoint, address, (0, 0, 0), 1)
+    swept = []
+    assert skt.sweep_passphrases(mnemonic, candidates, address, skt.XST,
+                                 workers=1, chunksize=1, checkpoint=checkpoint,
+                                 progress=lambda done, rate: swept.append(done)
+                                 ) == "salt2"
+    assert swept == [2]
+  finally:
+    os.remove(checkpoint)
+    os.rmdir(os.path.dirname(checkpoint))
+  assert skt.sweep_passphrases(mnemonic, candidates[:2], address, skt.XST,
+                               workers=2, chunksize=1) is None
+  print("Passphrase sweep works")
+
+  # cached extended keys are copies, deriving from one leaves the entry alone
+  xcache = skt.ExtendedKeyCache(maxsize=2)
+  xprv = key.ExtendedKey()
+  x1 = skt.BIP32Key.fromExtendedKey(xprv, public=True, cache=xcache)
+  x2 = skt.BIP32Key.fromExtendedKey(xprv, cache=xcache)
+  assert x1.public and not x2.public
+  assert x2.ExtendedKey() == xprv
+  assert x1.ExtendedKey(private=False) == key.ExtendedKey(private=False)
+  stats = xcache.stats()
+  assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+  print("Extended key cache works")
+
+  # bulk imports match single ones, repeats are separate keys, and a
+  # public key off the curve is refused
+  xpub = child_xst.ExtendedKey(private=False)
+  xkeys = [xprv, xpub, xprv]
+  serialize = lambda k: k.ExtendedKey(private=not k.public)
+  for public in (False, True):
+    imported = skt.BIP32Key.fromExtendedKeys(xkeys, public=public)
+    assert imported[0] is not imported[2]
+    assert [serialize(k) for k in imported] == [
+             serialize(skt.BIP32Key.fromExtendedKey(x, public)) for x in xkeys]
+  raw = skt.Base58.check_decode(xpub)
+  x = 1
+  while True:
+    try:
+      skt.bip32utils.secp256k1.decompress(b"\x02" + x.to_bytes(32, "big"))
+    except ValueError:
+      break
+    x += 1
+  for bad_x in (x, skt.bip32utils.secp256k1.P):
+    bad = skt.Base58.check_encode(raw[:45] + b"\x02" + bad_x.to_bytes(32, "big"))
+    for load in (skt.BIP32Key.fromExtendedKey,
+                 lambda xkey: skt.BIP32Key.fromExtendedKeys([xkey])):
+      try:
+        load(bad)
+      except ValueError:
+        pass
+      else:
+        raise AssertionError("imported a point off the curve")
+  print("Extended key import works")
+
+  # the tree derives the same keys, reusing the change node
+  tree = skt.DerivationTree(key, maxsize=8)
+  for i in range(3):
+    child = skt.get_child_key(tree, skt.PURPOSE, skt.XST.coin, 0, 0, i)
+    assert child.ExtendedKey() == skt.get_child_key(
+             key, skt.PURPOSE, skt.XST.coin, 0, 0, i).ExtendedKey()
+  child.SetPublic()
+  assert not skt.get_child_key(tree, skt.PURPOSE, skt.XST.coin, 0, 0, 2).public
+  stats = tree.stats()
+  assert (stats["size"], stats["hits"], stats["misses"]) == (7, 1, 3)
+  assert skt.get_child_key(key, skt.PURPOSE, skt.XST.coin).depth == 2
+  print("Derivation tree works")
+
+  # public and pickled children keep no private key of an ancestor
+  H = skt.BIP32_HARDEN
+  child = skt.get_child_key(key, skt.PURPOSE, 0, 0, 0, 5)
+  hardened = key.ChildKey(H).ChildKey(H + 1)
+  xpub, xprv = child.ExtendedKey(private=False), hardened.ExtendedKey()
+  child.SetPublic()
+  copy = pickle.loads(pickle.dumps(key.ChildKey(H).ChildKey(H + 1)))
+  for k in (child, pickle.loads(pickle.dumps(child)), copy):
+    state = k.__getstate__()
+    assert not any(isinstance(v, skt.BIP32Key) for v in state.values())
+    assert state["_parent_secret"] is None
+  assert child.ExtendedKey(private=False) == xpub
+  assert copy.ExtendedKey() == xprv
+  print("Parent keys are not kept")
+
+  # paths with a hardened account parse, compiled paths resolve in the tree
+  assert skt.parse_path("3'/1/7") == (3, 1, 7)
+  path = skt.BIP32Path("m/44'/125'/0'/0/2")
+  assert tree.get_key(path).ExtendedKey() == skt.get_child_key(
+           key, skt.PURPOSE, skt.XST.coin, 0, 0, 2).ExtendedKey()
+  print("Paths work")
+
+  # records are validated in order, failures are reported per record
+  records = [address_xst, address_btc, address_xst[:-1] + "0"]
+  chunks = list(skt.validate_records(records, 21, versions=[b"\x3e"],
+                                     workers=1, chunksize=2))
+  status = b"".join(bytes(c.status) for c in chunks)
+  assert list(status) == [0, 4, 1]
+  assert bytes(chunks[0].payloads[1:21]) == child_xst.Identifier()
+  print("Record validation works")
+
+  # every format comes from one hash160 and matches the key's own methods
+  addresses = skt.get_addresses(child_btc, skt.BTC, skt.ADDRESS_FORMATS)
+  assert addresses == {"p2pkh": address_btc,
+                       "p2sh-p2wpkh": child_btc.P2WPKHoP2SHAddress(),
+                       "p2wpkh": child_btc.P2WPKHAddress()}
+  assert skt.get_addresses([child_btc] * 2, skt.BTC, ["p2wpkh"]) == {
+           "p2wpkh": [child_btc.P2WPKHAddress()] * 2}
+  print("Address formats work")
+
+  # every available RIPEMD-160 provider gives the same addresses
+  ripemd160 = skt.bip32utils.ripemd160
+  active = ripemd160.get_provider()
+  try:
+    for provider in ripemd160.available_providers():
+      ripemd160.set_provider(provider)
+      child = skt.get_child_key(key, skt.PURPOSE, skt.BTC.coin, 0, 0, 0)
+      assert skt.get_addresses(child, skt.BTC, skt.ADDRESS_FORMATS) == addresses
+  finally:
+    ripemd160.set_provider(active)
+  print("RIPEMD-160 providers work (using %s)" % active)
+
+  # batched children match the ones derived one at a time
+  parent = skt.get_child_key(key, skt.PURPOSE, skt.XST.coin, 0, 0)
+  batch = skt.KeyBatch.derive(parent, range(4))
+  children = [parent.ChildKey(i) for i in range(4)]
+  assert [bytes(batch.public_key(i)) for i in range(4)] == [
+            c.PublicKey() for c in children]
+  assert list(batch.addresses(skt.XST)) == [
+            skt.XST.get_address(c) for c in children]
+  wrapped = skt.Currency("Wrapped", "WXST", skt.XST.coin,
+                         skt.XST.addr_net_byte, skt.XST.wif_net_byte,
+                         lambda k, b: skt.get_p2pkh_address(k, b))
+  assert list(batch.addresses(wrapped)) == list(batch.addresses(skt.XST))
+  assert list(batch.addresses(skt.ETH)) == [
+            skt.ETH.get_address(c) for c in children]
+  assert list(batch.wifs(skt.XST)) == [
+            skt.get_wif(c, skt.XST.wif_net_byte) for c in children]
+  assert batch.key(3).ExtendedKey() == children[3].ExtendedKey()
+  assert skt.get_p2pkh_addresses(children, skt.XST.addr_net_byte) == [
+            skt.get_p2pkh_address(c, skt.XST.addr_net_byte) for c in children]
+  print("Key batch works")
+
   print("----------------------------------------------------------------")
   print("All tests passed")
   print("----------------------------------------------------------------")